@@ -1,4 +1,3 @@
-import csv
 import fnmatch
 import os
 from random import choice, shuffle
@@ -68,7 +67,7 @@ class TUTProbe:
                 round(probetime, 2)
             )
         else:
-            return (0, 0)
+            return ('NA', 'NA')
 
     # Function for display
     def probe(self):
@@ -91,6 +90,9 @@ class Trial:
         self.trial_type = trial_type
 
     def setup_tracker(self, window, tracker, fix, auto_run):
+        # Link timings count from here
+        tracker.newTrial()
+
         # Check for fixation
         tracker.fixCheck(2, 0.1, 'z')
 
@@ -361,23 +363,32 @@ class Experiment:
         tut = TUTProbe(window)
 
         # Write the header to the output file
-        header = [
-            'sub',      # Subject id
-            'tcateg',   # Target category
-            'tnum',     # Trial number
-            'bnum',     # Block number
-            'tar',      # If target was present
-            'sim',      # If similar was present
-            'resp',     # The response key
-            'rtype',    # The response type (one in ['hi', 'mi', 'fa', 'cr'])
-            'rt',       # Response time
-            'time',     # Trial start time
-            'tutra',    # TUT rating
-            'tuttime',  # TUT test time
-            'hunger',   # The first question's response
-            'tired',    # The second question's response
-        ]
-        output_file.writerow(header)
+        record = pylinkwrapper.trialrecord([
+            ('sub', str),       # Subject id
+            ('tcateg', str),    # Target category
+            ('tnum', int),      # Trial number
+            ('bnum', int),      # Block number
+            ('tar', bool),      # If target was present
+            ('sim', bool),      # If similar was present
+            ('resp', str),      # The response key
+            ('rtype', str),     # The response type (one in ['hi', 'mi', 'fa', 'cr'])
+            ('rt', float),      # Response time
+            ('time', float),    # Trial start time
+            ('tutra', int),     # TUT rating
+            ('tuttime', float), # TUT test time
+            ('hunger', int),    # The first question's response
+            ('tired', int),     # The second question's response
+        ])
+        output_file.writerow(record.header)
+        output_file.addColumns(record)  # Typed copy for analysis
+
+        # Running d', criterion and RT by block, foil type and TUT rating.
+        # Targets count towards both foil types, and each rating covers the
+        # trials since the previous probe.
+        sdt = pylinkwrapper.sdtengine(('bnum', 'tutra'),
+                                      foils={'sim': (True, False)},
+                                      carry=('tutra',))
+        output_file.addListener(record, sdt.update)
 
         image_log_header = [
             'sub',
@@ -422,6 +433,7 @@ class Experiment:
                 trial_time = round(exptime.getTime(), 2)
 
                 # Draw images and await a response
+                tracker.flipMessage('stimonset')
                 key, response_time = trial.draw_loop(window, dots, self.auto_run)
 
                 # Quit?
@@ -463,12 +475,15 @@ class Experiment:
                 )
 
                 # Eye-tracker post-stim
-                for key, value in trial_results.iteritems():
-                    tracker.sendVar(key, value)
+                trial_cells = record.serialize(trial_results)
+                tracker.sendVars(record, trial_cells)
                 tracker.setTrialResult()
 
                 # Write trial info
-                output_file.writerow([trial_results[col] for col in header])
+                output_file.writerow(trial_cells)
+                output_file.endTrial()
+                if image_log_file:
+                    image_log_file.endTrial()
 
                 # ISI
                 fix.draw()
@@ -476,7 +491,12 @@ class Experiment:
                 if not self.auto_run:
                     core.wait(2)
 
-        tracker.endExperiment(experiment_path)
+        for sdtmsg in sdt.messages():
+            tracker.sendMessage(sdtmsg)
+        tracker.endExperiment(experiment_path,
+                              debrief='Thank you for participating!\n\n'
+                                      'Please let the researcher know you '
+                                      'are done.')
         core.quit()
 
 
@@ -557,9 +577,11 @@ def main(auto_run):
         images=images,
         auto_run=auto_run,
     )
-    output_file = csv.writer(open(os.path.join(os.getcwd(), 'data_exp2', subject.id + '_mindwand_exp2.csv'), 'wb'))
+    output_file = tracker.attach(pylinkwrapper.resultswriter(
+        os.path.join(os.getcwd(), 'data_exp2', subject.id + '_mindwand_exp2.csv')))
     # To disable image logging, comment out the following line and uncomment the line after.
-    image_log_file = csv.writer(open(os.path.join(os.getcwd(), 'data_exp2', subject.id + '_mindwand_exp2_images.csv'), 'wb'))
+    image_log_file = tracker.attach(pylinkwrapper.resultswriter(
+        os.path.join(os.getcwd(), 'data_exp2', subject.id + '_mindwand_exp2_images.csv')))
     # image_log_file = None
     experiment_path = 'C:\\edfs\\Nick\\mindwand\\'
 
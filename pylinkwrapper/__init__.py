@@ -1,2 +1,23 @@
 # Initialize functions class
-from pylinkwrapper.connector import connect
\ No newline at end of file
+from pylinkwrapper import synth
+from pylinkwrapper.linkstats import linkstats
+from pylinkwrapper.records import trialrecord
+from pylinkwrapper.beeps import beeper
+from pylinkwrapper.results import resultswriter
+from pylinkwrapper.sdt import sdtengine
+from pylinkwrapper.simtracker import simtracker
+
+# Tracker modules need pylink and psychopy, which analysis machines and the
+# pipeline workers don't have. Any other import error is a real problem.
+try:
+    from pylinkwrapper.connector import connect
+    from pylinkwrapper.stream import gazestream
+    from pylinkwrapper.detect import hitIA, ivt
+except ImportError as err:
+    missing = getattr(err, 'name', None) or str(err).split()[-1]
+    if missing.split('.')[0] not in ('pylink', 'psychopy'):
+        raise
+
+# Offline analysis is imported where it is used, e.g.
+# ``from pylinkwrapper import pipeline``: columns, ascparse, store, metrics,
+# spatial, pupil and pipeline.
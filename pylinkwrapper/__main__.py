@@ -0,0 +1,80 @@
+# Command line tools, e.g. python -m pylinkwrapper pull C:\edfs\
+import argparse
+import os
+import sys
+from pylinkwrapper import transfer
+
+
+def pull(args):
+    # Connect and fetch anything left in the queue, pylink is only needed here
+    import pylink
+
+    tracker = pylink.EyeLink(args.address)
+    tracker.setOfflineMode()
+
+    def report(xfer):
+        if xfer.ok:
+            print('{} -> {} ({} bytes)'.format(xfer.src, xfer.dest, xfer.size))
+        else:
+            print('{} failed: {}'.format(xfer.src, xfer.error))
+
+    qpath = os.path.join(args.spath, 'pending_edfs.json')
+    left = transfer.pullQueued(tracker, qpath, args.retries, report)
+    tracker.close()
+
+    return 1 if left else 0
+
+
+def analyze(args):
+    # Process every session and save the group arrays
+    import numpy as np
+    from pylinkwrapper import pipeline
+
+    group = pipeline.run(args.datadir, args.cache, args.eyedir, args.procs)
+
+    arrays = {'subjects': np.array(group['subjects'])}
+    for name, col in group['behav'].items():
+        arrays['behav_' + name] = col
+    for name, levels in group['levels'].items():
+        arrays['levels_' + name] = np.array(levels)
+    arrays['behavsubject'] = group['behavsubject']
+    for name in pipeline.TABLES:
+        if name in group:
+            arrays[name] = group[name]
+
+    out = args.out or os.path.join(args.datadir, 'group.npz')
+    np.savez(out, **arrays)
+    print('{} subjects, {} trials -> {}'.format(
+        len(group['subjects']), len(group['behavsubject']), out))
+
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pylinkwrapper')
+    sub = parser.add_subparsers(dest='command')
+
+    pparse = sub.add_parser('pull', help='Retrieve EDFs whose transfer failed')
+    pparse.add_argument('spath', help='Folder passed to endExperiment')
+    pparse.add_argument('--address', default='100.1.1.1',
+                        help='EyeLink host address')
+    pparse.add_argument('--retries', type=int, default=3)
+    pparse.set_defaults(func=pull)
+
+    aparse = sub.add_parser('analyze',
+                            help='Process all sessions into group arrays')
+    aparse.add_argument('datadir', help='Folder with the results CSVs')
+    aparse.add_argument('--eyedir', help='Folder with the EDF or ASC files')
+    aparse.add_argument('--cache', help='Cache folder')
+    aparse.add_argument('--procs', type=int, help='Number of processes')
+    aparse.add_argument('--out', help='Output .npz, default group.npz in '
+                                      'datadir')
+    aparse.set_defaults(func=analyze)
+
+    args = parser.parse_args(argv)
+
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+# Reading EyeLink ASC files into NumPy arrays
+import re
+import string
+import warnings
+import numpy as np
+from synth import GDTYPE, EDTYPE
+
+# One row per TRIALID. start and end are the times of the trial's first
+# recording, and the sample and event ranges are its [first, last) offsets
+# into the session arrays. result is -1 until TRIAL_RESULT is seen.
+TDTYPE = np.dtype([('trialid', 'f8'), ('start', 'f8'), ('end', 'f8'),
+                   ('sfirst', 'i8'), ('slast', 'i8'),
+                   ('efirst', 'i8'), ('elast', 'i8'),
+                   ('pupiltime', '?'), ('result', 'i4')])
+
+# Sample line columns of time, x, y and pupil, per eye when binocular
+MONOCOLS = [0, 1, 2, 3]
+BINCOLS = {'L': [0, 1, 2, 3], 'R': [0, 4, 5, 6]}
+
+# Lines that are not samples, which start with the time. Searched for in the
+# chunk with a newline in front, so every line follows a newline.
+OTHER = re.compile(br'\n((?![0-9])[^\n]*)')
+
+# Sample flags become dots, e.g. 'C..' to '...', so they can be dropped with
+# one replace
+FLAGDOTS = bytes(bytearray(c if chr(c) not in string.ascii_letters
+                           else ord('.') for c in range(256)))
+
+
+def parse(path, eye='R', chunk=1 << 24):
+    """
+    Reads an ASC file, e.g. from ``edf2asc`` or ``synth.writeASC``, in chunks
+    of ``chunk`` bytes. The sample lines of a chunk are converted together
+    with NumPy; only the other lines are handled one by one.
+
+    Messages the connector writes are split into per trial tables:
+    ``TRIALID`` starts a trial, ``!V IAREA RECTANGLE`` lines go to ``ias``,
+    ``!V TRIAL_VAR`` lines to ``vars``, ``TRIAL_RESULT`` and ``pupiltime`` to
+    ``trials``. Message times have the offset of ``flipMessage`` messages
+    subtracted. Everything before the first ``TRIALID`` has trial -1.
+
+    A trial's samples and events are those of its first recording, from the
+    first ``START`` after ``TRIALID`` to the next ``END``. Later recordings
+    before the next ``TRIALID``, e.g. the ``fixCheck`` between trials, belong
+    to no trial. Binocular events are kept for ``eye`` only.
+
+    :param path: ASC file to read.
+    :type path: str
+    :param eye: Eye to keep from binocular recordings, 'L' or 'R'.
+    :type eye: str
+    :param chunk: Bytes read at a time.
+    :type chunk: int
+    :returns: Dictionary with ``samples`` (``synth.GDTYPE``), ``events``
+              (``synth.EDTYPE``), ``trials`` (``TDTYPE``) and structured
+              arrays ``ias`` (trial, index, name, l, t, r, b), ``vars``
+              (trial, name, value) and ``msgs`` (trial, time, text).
+    :rtype: dict
+    """
+
+    samples = []
+    nsamp = 0
+    events = []
+    trials = []
+    ias = []
+    tvars = []
+    msgs = []
+    cols = MONOCOLS
+    binoc = False
+
+    # Whether the current trial's recording is under way, see docstring
+    tnum = -1
+    inrec = False
+    with open(path, 'rb') as asc:
+        rest = b''
+        while True:
+            buff = asc.read(chunk)
+            if buff:
+                buff = rest + buff
+                cut = buff.rfind(b'\n') + 1
+                buff, rest = buff[:cut], buff[cut:]
+            else:
+                buff, rest = rest + b'\n', b''
+
+            # Lines other than samples in file order, counting the samples
+            # in between and keeping them aside, all in one pass
+            body = b'\n' + buff
+            seen = 0
+            pos = 0
+            block = []
+            for match in OTHER.finditer(body, 0, len(body) - 1):
+                block.append(body[pos + 1:match.start() + 1])
+                seen += block[-1].count(b'\n')
+                pos = match.end()
+                line = match.group(1).strip()
+                parts = line.split(None, 2)
+                if not parts:
+                    continue
+
+                kind = parts[0]
+                if kind == b'MSG':
+                    mtime, text = _message(parts)
+                    if text.startswith(b'TRIALID'):
+                        if inrec:
+                            trials[tnum]['slast'] = nsamp + seen
+                            inrec = False
+                        tnum += 1
+                        trial = np.zeros(1, dtype=TDTYPE)[0]
+                        trial['trialid'] = mtime
+                        trial['start'] = trial['end'] = np.nan
+                        trial['sfirst'] = trial['slast'] = nsamp + seen
+                        trial['efirst'] = trial['elast'] = len(events)
+                        trial['result'] = -1
+                        trials.append(trial)
+                    elif tnum < 0:
+                        pass
+                    elif text.startswith(b'!V IAREA RECTANGLE'):
+                        ia = text.split()
+                        ias.append((tnum, int(ia[3]), b' '.join(ia[8:]),
+                                    float(ia[4]), float(ia[5]),
+                                    float(ia[6]), float(ia[7])))
+                    elif text.startswith(b'!V TRIAL_VAR'):
+                        tv = text.split(None, 3)
+                        tvars.append((tnum, tv[2],
+                                      tv[3] if len(tv) > 3 else b''))
+                    elif text.startswith(b'TRIAL_RESULT'):
+                        trials[tnum]['result'] = int(text.split()[1])
+                    elif text == b'pupiltime':
+                        trials[tnum]['pupiltime'] = True
+                    msgs.append((tnum, mtime, text))
+                elif kind in (b'EFIX', b'ESACC', b'EBLINK'):
+                    ev = line.split()
+                    if binoc and ev[1].decode() != eye:
+                        continue
+                    events.append(_event(ev))
+                    if inrec:
+                        trials[tnum]['elast'] = len(events)
+                elif kind == b'START':
+                    binoc = b'LEFT' in line and b'RIGHT' in line
+                    cols = BINCOLS[eye] if binoc else MONOCOLS
+                    if tnum >= 0 and np.isnan(trials[tnum]['start']):
+                        inrec = True
+                        trial = trials[tnum]
+                        trial['start'] = float(parts[1])
+                        trial['sfirst'] = trial['slast'] = nsamp + seen
+                        trial['efirst'] = trial['elast'] = len(events)
+                elif kind == b'END' and inrec:
+                    trials[tnum]['end'] = float(parts[1])
+                    trials[tnum]['slast'] = nsamp + seen
+                    inrec = False
+
+            # Then all samples of the chunk at once
+            block.append(body[pos + 1:])
+            samp = b''.join(block)
+            if samp.strip():
+                samples.append(_samples(samp, cols))
+                nsamp += samples[-1].size
+            if inrec:
+                trials[tnum]['slast'] = nsamp
+
+            if not rest and len(buff) <= 1:
+                break
+
+    # Build the output tables
+    if samples:
+        samples = np.concatenate(samples)
+    else:
+        samples = np.zeros(0, dtype=GDTYPE)
+
+    evarr = np.zeros(len(events), dtype=EDTYPE)
+    for i, ev in enumerate(events):
+        evarr[i] = ev
+
+    return {'samples': samples, 'events': evarr,
+            'trials': np.array(trials, dtype=TDTYPE),
+            'ias': _table(ias, ['trial', 'index', 'name', 'l', 't', 'r', 'b'],
+                          ['i4', 'i4', None, 'f4', 'f4', 'f4', 'f4']),
+            'vars': _table(tvars, ['trial', 'name', 'value'],
+                           ['i4', None, None]),
+            'msgs': _table(msgs, ['trial', 'time', 'text'],
+                           ['i4', 'f8', None])}
+
+
+def _samples(text, cols):
+    # Read the whole chunk with one NumPy call when every line has the same
+    # number of fields, after dropping the flags field that ends each line
+    # and spelling out missing values, a single '.', as nan
+    nline = text.count(b'\n')
+    fields = text[:text.find(b'\n')].split()
+    ncol = len(fields)
+    flat = text
+    if fields and not any(c.isdigit() for c in fields[-1].decode()):
+        flat = flat.translate(FLAGDOTS).replace(
+            b'\t' + fields[-1].translate(FLAGDOTS), b'')
+        ncol -= 1
+    flat = flat.replace(b' .', b' nan').replace(b'\t.', b'\tnan')
+    try:
+        # Stray text warns or raises depending on the NumPy version
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            vals = np.fromstring(flat, sep=' ')
+    except (ValueError, DeprecationWarning):
+        vals = None
+
+    if ncol and vals is not None and vals.size == ncol * nline:
+        vals = vals.reshape(nline, ncol)[:, cols]
+    else:
+        # Odd lines, token by token
+        rows = [line.split() for line in text.splitlines() if line.strip()]
+        tok = np.array([[row[c] if c < len(row) else b'.' for c in cols]
+                        for row in rows])
+        tok[tok == b'.'] = b'nan'
+        vals = tok.astype('f8')
+
+    samp = np.zeros(len(vals), dtype=GDTYPE)
+    for i, name in enumerate(GDTYPE.names):
+        samp[name] = vals[:, i]
+
+    return samp
+
+
+def _message(parts):
+    # 'MSG <time> [<offset>] <text>', the offset counts back from time
+    mtime = float(parts[1])
+    text = parts[2] if len(parts) > 2 else b''
+    head = text.split(None, 1)
+    if len(head) == 2 and head[0].lstrip(b'-').isdigit():
+        mtime -= int(head[0])
+        text = head[1]
+
+    return mtime, text
+
+
+def _event(f):
+    # EFIX eye start end dur x y pupil, ESACC eye start end dur sx sy ex ey
+    # ..., EBLINK eye start end dur, split into fields
+    nan = float('nan')
+    if f[0] == b'EFIX':
+        x, y = _num(f[5]), _num(f[6])
+        return (b'F', float(f[2]), float(f[3]), x, y, x, y)
+    if f[0] == b'ESACC':
+        return (b'S', float(f[2]), float(f[3]), _num(f[5]), _num(f[6]),
+                _num(f[7]), _num(f[8]))
+
+    return (b'B', float(f[2]), float(f[3]), nan, nan, nan, nan)
+
+
+def _num(tok):
+    return float('nan') if tok == b'.' else float(tok)
+
+
+def _table(rows, names, dtypes):
+    # Structured array, text columns sized to their longest entry
+    cols = list(zip(*rows)) if rows else [[] for n in names]
+    fields = []
+    for name, dtype, col in zip(names, dtypes, cols):
+        if dtype is None:
+            dtype = 'S{}'.format(max([len(v) for v in col] + [1]))
+        fields.append((name, dtype))
+
+    table = np.zeros(len(rows), dtype=fields)
+    for name, col in zip(names, cols):
+        table[name] = col
+
+    return table
+
+
+def trialvars(tvars, record=None):
+    """
+    Pivots the ``vars`` table to one list per variable with an entry per
+    trial, None where a trial did not send the variable.
+
+    :param tvars: ``vars`` from ``parse``.
+    :param record: Converts values with ``trialrecord.typed`` if given,
+                   otherwise they stay text.
+    :type record: records.trialrecord
+    :returns: Dictionary of variable name to list.
+    :rtype: dict
+    """
+
+    ntrial = int(tvars['trial'].max()) + 1 if len(tvars) else 0
+    names = record.header if record is not None else sorted(
+        set(n.decode() for n in tvars['name']))
+
+    table = dict((name, [None] * ntrial) for name in names)
+    for tnum, name, value in tvars:
+        name = name.decode()
+        if name in table:
+            table[name][tnum] = value.decode()
+
+    if record is not None:
+        rows = zip(*[[record.na if v is None else v for v in table[name]]
+                     for name in names])
+        typed = [record.typed(row) for row in rows]
+        table = dict((name, [row[i] for row in typed])
+                     for i, name in enumerate(names))
+
+    return table
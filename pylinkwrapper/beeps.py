@@ -0,0 +1,188 @@
+# Calibration feedback tones played off the callback thread
+import os
+import threading
+import wave
+from timeit import default_timer
+import numpy as np
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+# Name: (frequency in Hz, duration in seconds)
+TONES = {'target': (800, .1), 'done': (1200, .1), 'error': (400, .1)}
+
+
+def tone(freq, secs, rate=44100):
+    """
+    Makes a sine tone with short ramps to avoid clicks.
+
+    :param freq: Frequency in Hz.
+    :type freq: float
+    :param secs: Duration in seconds.
+    :type secs: float
+    :param rate: Sample rate in Hz.
+    :type rate: int
+    :returns: Samples between -1 and 1.
+    :rtype: numpy.ndarray
+    """
+
+    t = np.arange(int(secs * rate)) / float(rate)
+    snd = np.sin(2 * np.pi * freq * t)
+
+    # 5 ms on and off ramps
+    ramp = min(int(.005 * rate), len(snd) // 2)
+    if ramp:
+        env = np.linspace(0, 1, ramp)
+        snd[:ramp] *= env
+        snd[-ramp:] *= env[::-1]
+
+    return snd.astype(np.float32)
+
+
+class beeper(object):
+    """
+    Plays feedback tones without blocking the caller. Tones are rendered and
+    loaded into the audio device when created, and ``play`` only puts the tone
+    name on a queue for a worker thread. The time from ``play`` until the
+    device call returns is stored for each tone in ``latency``.
+
+    Backends are 'psychopy' (``psychopy.sound``), 'wave' (appends everything
+    played to a wave file, for running without speakers) and 'null' (plays
+    nothing).
+
+    :param backend: Audio backend name.
+    :type backend: str
+    :param tones: Tone definitions as name: (Hz, seconds).
+    :type tones: dict
+    :param wavpath: Output file for the 'wave' backend.
+    :type wavpath: str
+    :param rate: Sample rate in Hz.
+    :type rate: int
+    :param size: Number of latencies that can be stored.
+    :type size: int
+    """
+
+    def __init__(self, backend='psychopy', tones=TONES, wavpath=None,
+                 rate=44100, size=10000):
+        self.backend = backend
+        self.rate = rate
+
+        # Render every tone up front
+        self.buffers = dict((name, tone(freq, secs, rate))
+                            for name, (freq, secs) in tones.items())
+
+        # Latency log in seconds
+        self.latency = np.zeros(size, dtype=np.float32)
+        self.n = 0
+
+        # Set up the device
+        self.wav = None
+        self.sounds = {}
+        self.closed = False
+        if backend == 'psychopy':
+            from psychopy import sound
+            for name, buff in self.buffers.items():
+                self.sounds[name] = sound.Sound(buff, sampleRate=rate)
+        elif backend == 'wave':
+            if wavpath is None:
+                raise ValueError('wave backend needs a wavpath')
+            wdir = os.path.dirname(wavpath)
+            if wdir and not os.path.isdir(wdir):
+                os.makedirs(wdir)
+            self.wav = wave.open(wavpath, 'wb')
+            self.wav.setnchannels(1)
+            self.wav.setsampwidth(2)
+            self.wav.setframerate(rate)
+            self.pcm = dict((name, (buff * 32767).astype('<i2').tobytes())
+                            for name, buff in self.buffers.items())
+        elif backend != 'null':
+            raise ValueError('Unknown audio backend: {}'.format(backend))
+
+        # Worker thread
+        self.queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, name='beeper')
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.prewarm()
+
+    def prewarm(self):
+        """
+        Plays every tone silently so the first real beep doesn't pay for
+        opening the device. Called on creation; call again if the device may
+        have gone idle, e.g. before a calibration. Does nothing for the
+        'wave' and 'null' backends.
+        """
+
+        for snd in self.sounds.values():
+            snd.setVolume(0)
+            snd.play()
+            snd.stop()
+            snd.setVolume(1)
+
+    def play(self, name):
+        """
+        Queues a tone and returns immediately.
+
+        :param name: Tone name, e.g. 'target', 'done' or 'error'.
+        :type name: str
+        """
+
+        self.queue.put((name, default_timer()))
+
+    def wait(self):
+        """
+        Blocks until every queued tone has been started.
+        """
+
+        self.queue.join()
+
+    def close(self):
+        """
+        Plays anything still queued, stops the worker and closes the device.
+        Safe to call more than once.
+        """
+
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self._thread.join()
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
+
+    def stats(self):
+        """
+        Summarises play latency.
+
+        :returns: Dictionary with ``n``, ``mean`` and ``max`` in ms.
+        :rtype: dict
+        """
+
+        lat = self.latency[:self.n] * 1000.0
+        if not len(lat):
+            return {'n': 0, 'mean': 0.0, 'max': 0.0}
+
+        return {'n': len(lat), 'mean': float(lat.mean()),
+                'max': float(lat.max())}
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+
+            name, queued = item
+            if self.backend == 'psychopy':
+                self.sounds[name].play()
+            elif self.backend == 'wave':
+                self.wav.writeframes(self.pcm[name])
+
+            if self.n < len(self.latency):
+                self.latency[self.n] = default_timer() - queued
+                self.n += 1
+            self.queue.task_done()
@@ -0,0 +1,214 @@
+# Typed columnar copy of trial results
+import json
+import os
+import numpy as np
+
+# Storage per trialrecord column type: (dtype, missing value)
+KINDS = {float: ('<f8', float('nan')), int: ('<i4', -2 ** 31),
+         bool: ('i1', -1), str: ('<i2', -1)}
+
+META = 'meta.json'
+
+
+class columnwriter(object):
+    """
+    Writes trial results as one binary file per column, so sessions can be
+    memory-mapped and combined without parsing text. Float, int and bool
+    columns keep their values, str columns are stored as integer codes into a
+    list of levels. Missing values are NaN for floats and -1 (bool, str) or
+    -2**31 (int) otherwise.
+
+    Rows are appended to :file:`<column>.bin` as they come in and
+    :file:`meta.json` is rewritten with the row count and levels, so an
+    interrupted session can still be loaded. ``close`` turns each column into
+    a :file:`<column>.npy` file.
+
+    Usually driven by ``results.resultswriter.addColumns``.
+
+    :param path: Folder to write the columns to.
+    :type path: str
+    :param record: Column layout of the rows.
+    :type record: records.trialrecord
+    """
+
+    def __init__(self, path, record):
+        self.path = path
+        self.record = record
+        self.rows = 0
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.cols = []
+        for name, ctype in zip(record.header, record.types):
+            dtype, na = KINDS[ctype]
+            col = {'name': name, 'type': ctype.__name__, 'dtype': dtype,
+                   'na': None if ctype is float else na}
+            if ctype is str:
+                col['levels'] = []
+            self.cols.append(col)
+
+        self.codes = [{} for col in self.cols]
+        self.files = [open(self._raw(col['name']), 'wb') for col in self.cols]
+        self._writeMeta(False)
+
+    def _raw(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    def _writeMeta(self, done):
+        meta = {'rows': self.rows, 'done': done, 'na': self.record.na,
+                'columns': self.cols}
+        tmp = os.path.join(self.path, META + '.tmp')
+        with open(tmp, 'w') as mf:
+            json.dump(meta, mf, indent=1)
+        if os.path.exists(os.path.join(self.path, META)):
+            os.remove(os.path.join(self.path, META))
+        os.rename(tmp, os.path.join(self.path, META))
+
+    def append(self, rows):
+        """
+        Appends serialized rows.
+
+        :param rows: Lists of cells as made by ``trialrecord.serialize``.
+        :type rows: list
+        """
+
+        if not rows:
+            return
+
+        vals = zip(*[self.record.typed(row) for row in rows])
+        for i, (col, cvals) in enumerate(zip(self.cols, vals)):
+            dtype = col['dtype']
+            na = KINDS[self.record.types[i]][1]
+            if 'levels' in col:
+                codes = self.codes[i]
+                for val in cvals:
+                    if val is not None and val not in codes:
+                        codes[val] = len(col['levels'])
+                        col['levels'].append(val)
+                cvals = [na if val is None else codes[val] for val in cvals]
+            else:
+                cvals = [na if val is None else val for val in cvals]
+            self.files[i].write(np.asarray(cvals, dtype=dtype).tobytes())
+            self.files[i].flush()
+
+        self.rows += len(rows)
+        self._writeMeta(False)
+
+    def close(self):
+        """
+        Converts the columns to :file:`.npy` files.
+        """
+
+        if self.files is None:
+            return
+
+        for col, cf in zip(self.cols, self.files):
+            cf.close()
+            raw = self._raw(col['name'])
+            np.save(os.path.join(self.path, col['name'] + '.npy'),
+                    np.fromfile(raw, dtype=col['dtype']))
+            os.remove(raw)
+        self.files = None
+        self._writeMeta(True)
+
+
+def load(path, mmap_mode='r'):
+    """
+    Opens a session written by ``columnwriter``.
+
+    :param path: Folder of the session.
+    :type path: str
+    :param mmap_mode: Passed to ``numpy.load``. None reads into memory.
+    :type mmap_mode: str
+    :returns: Dictionary of column name to array, and the metadata with
+              ``levels`` for str columns.
+    :rtype: tuple
+    """
+
+    with open(os.path.join(path, META)) as mf:
+        meta = json.load(mf)
+
+    data = {}
+    for col in meta['columns']:
+        npy = os.path.join(path, col['name'] + '.npy')
+        if os.path.exists(npy):
+            data[col['name']] = np.load(npy, mmap_mode=mmap_mode)
+        else:
+            # Interrupted session, only the rows listed in meta are complete
+            raw = np.fromfile(os.path.join(path, col['name'] + '.bin'),
+                              dtype=col['dtype'])
+            data[col['name']] = raw[:meta['rows']]
+
+    return data, meta
+
+
+def decode(codes, levels, na=None):
+    """
+    Turns the codes of a str column back into values.
+
+    :param codes: Code array.
+    :param levels: Levels of the column.
+    :type levels: list
+    :param na: Value used for missing entries.
+    :returns: Object array of values.
+    :rtype: numpy.ndarray
+    """
+
+    lut = np.array(list(levels) + [na], dtype=object)
+    codes = np.asarray(codes)
+
+    return lut[np.where(codes < 0, len(levels), codes)]
+
+
+def concat(paths):
+    """
+    Joins several sessions column by column. Str columns are recoded to the
+    union of the sessions' levels, in order of first appearance. Every
+    session must have the same columns with the same types.
+
+    :param paths: Session folders.
+    :type paths: list
+    :returns: Dictionary of column name to array, and a dictionary of str
+              column name to levels.
+    :rtype: tuple
+    :raises ValueError: If the sessions' columns or types differ.
+    """
+
+    parts = {}
+    levels = {}
+    kinds = None
+    for path in paths:
+        data, meta = load(path)
+
+        # Stacking mismatched columns would mix codes with values
+        skinds = dict((col['name'], '{} {}'.format(
+            col['type'], np.dtype(col['dtype']).str))
+            for col in meta['columns'])
+        if kinds is None:
+            kinds, first = skinds, path
+        elif skinds != kinds:
+            diff = sorted(name for name in set(kinds) | set(skinds)
+                          if kinds.get(name) != skinds.get(name))
+            raise ValueError('Columns of {} differ from {}: {}'.format(
+                path, first, ', '.join('{} {} vs {}'.format(
+                    name, skinds.get(name, 'missing'),
+                    kinds.get(name, 'missing')) for name in diff)))
+
+        for col in meta['columns']:
+            vals = data[col['name']]
+            if 'levels' in col:
+                # Map this session's codes to the shared levels
+                shared = levels.setdefault(col['name'], [])
+                remap = np.empty(len(col['levels']) + 1, dtype=col['dtype'])
+                for i, lev in enumerate(col['levels']):
+                    if lev not in shared:
+                        shared.append(lev)
+                    remap[i] = shared.index(lev)
+                remap[-1] = -1
+                vals = remap[np.where(vals < 0, len(col['levels']), vals)]
+            parts.setdefault(col['name'], []).append(vals)
+
+    data = dict((name, np.concatenate(vals)) for name, vals in parts.items())
+
+    return data, levels
@@ -1,9 +1,15 @@
 # Pylink wrapper for Psychopy
 import pylink
 import psychocal
+import stream
+import detect
+import transfer
+import linkstats
 import time
+import math
+import re
 from psychopy.tools.monitorunittools import deg2pix
-from psychopy import event
+from psychopy import core, event, visual
 
 class connect(object):
     """
@@ -11,31 +17,80 @@ class connect(object):
 
     :param window: Psychopy window object.
     :param edfname: Desired name of the EDF file.
+    :param srate: Sampling rate of the tracker in Hz.
+    :param tracker: Tracker object to use instead of connecting to the
+                    EyeLink, e.g. a ``simtracker.simtracker``.
+    :param instrument: Time link calls, see ``linkstats.linkstats``. Calls
+                       are counted per trial from each ``newTrial``. At
+                       endExperiment the session summary is written to the
+                       EDF and per trial summaries to
+                       :file:`<edfname>_linkstats.csv` in ``spath``.
+    :param audio: Backend for calibration beeps, 'psychopy', 'wave' or 'null'.
+                  See ``beeps.beeper``.
     """
 
-    def __init__(self, window, edfname):
+    def __init__(self, window, edfname, srate=1000, tracker=None,
+                 instrument=False, audio='psychopy'):
         # Pull out monitor info
         self.sres = window.size
         self.win = window
+        self.srate = srate
+        self.audio = audio
         
         # Make filename
         self.edfname = edfname + '.edf'
         
         # Initialize connection with eye-tracker
-        try:
-            self.tracker = pylink.EyeLink()
+        if tracker is not None:
+            self.tracker = tracker
             self.realconnect = True
-        except:
-            self.tracker = pylink.EyeLink(None)
-            self.realconnect = False
-            
+        else:
+            self.connect()
+
+        # Time link calls
+        self.stats = None
+        if instrument:
+            self.stats = linkstats.linkstats(self.tracker)
+            self.tracker = self.stats
+
+        # One call at a time, the link stream reads from another thread
+        self.tracker = stream.lockedtracker(self.tracker)
+
         # Make pylink accessible
         self.pylink = pylink
+
+        # Calibration display, see calDisplay
+        self.genv = None
+
+        # Link data buffer, see startStream
+        self.stream = None
+
+        # Interest areas of the current trial, see drawIA
+        self.ias = []
+
+        # Drift in degrees at each drift correction, see driftCorrect
+        self.drifts = []
+
+        # Objects closed in endExperiment, see attach
+        self.closers = []
+
+        # Time spent waiting for the EyeLink in recordON
+        self.rwaits = []
+
+        # Messages waiting for the next flip and when the last flip callback
+        # ran, see flipMessage
+        self.flipq = []
+        self.lastflip = None
+
+        # Local copy of host state so redundant commands can be dropped
+        self.dropped = 0
+        self.resync()
         
         # Open EDF
         self.tracker.openDataFile(self.edfname)		
         pylink.flushGetkeyQueue() 
         self.tracker.setOfflineMode()
+        self.hstate['mode'] = 'idle'
 
         # Set content of edf file
         eftxt = 'LEFT,RIGHT,FIXATION,SACCADE,BLINK,MESSAGE,BUTTON,INPUT'
@@ -54,6 +109,39 @@ class connect(object):
         disptxt = 'DISPLAY_COORDS 0 0 {} {}'.format(*self.sres)
         self.tracker.sendMessage(disptxt)
 
+    def connect(self):
+        """
+        Connects to the EyeLink, falling back to a dummy connection.
+        """
+
+        try:
+            self.tracker = pylink.EyeLink()
+            self.realconnect = True
+        except:
+            self.tracker = pylink.EyeLink(None)
+            self.realconnect = False
+
+    def calDisplay(self):
+        """
+        Returns the psychopy calibration display, building it on first use so
+        its stimuli are reused by every calibration and drift correction. Its
+        beeper is closed in endExperiment.
+
+        :rtype: psychocal.psychocal
+        """
+
+        if self.genv is None:
+            self.genv = psychocal.psychocal(self.sres[0], self.sres[1],
+                                            self.tracker, self.win,
+                                            backdrop=True, audio=self.audio,
+                                            wavpath=self.edfname[:-4] +
+                                            '_beeps.wav')
+
+            # Stops the beep thread and closes the wave file
+            self.attach(self.genv.beeps)
+
+        return self.genv
+
     def calibrate(self, cnum=13, paval=1000):
         """
         Calibrates eye-tracker using psychopy stimuli.
@@ -66,10 +154,9 @@ class connect(object):
         :type paval: int
         """
         
-        # Generate custom calibration stimuli
-        genv = psychocal.psychocal(self.sres[0], self.sres[1],
-                                    self.tracker, self.win)
-                                    
+        # Custom calibration stimuli
+        genv = self.calDisplay()
+
         if self.realconnect:
             # Set calibration type
             calst = 'HV{}'.format(cnum)
@@ -83,6 +170,7 @@ class connect(object):
             
             # Calibrate
             self.tracker.doTrackerSetup(self.sres[0], self.sres[1])
+            self.resync()
         else:
             genv.dummynote()
         
@@ -94,8 +182,19 @@ class connect(object):
         :type message: str
         """
         msg = "record_status_message '{}'".format(message)
-        self.tracker.sendCommand(msg)
+        self.sendCommand(msg)
         
+    def newTrial(self):
+        """
+        Marks the start of an experiment trial for the link call timings, see
+        ``instrument``. Call it once per trial before anything else, e.g. the
+        ``fixCheck``, so everything the trial does is counted under it, even
+        when it sends several TRIALIDs. Does nothing without ``instrument``.
+        """
+
+        if self.stats is not None:
+            self.stats.newTrial()
+
     def setTrialID(self, idval=1):
         """
         Sends message that indicates start of trial in EDF.
@@ -105,29 +204,111 @@ class connect(object):
 
         tid = 'TRIALID {}'.format(idval)
         self.tracker.sendMessage(tid)
+
+        # New trial, new interest areas
+        self.ias = []
         
-    def recordON(self, sendlink=False):
+    def recordON(self, sendlink=False, maxwait=.05):
         """
-        Starts recording. Waits 50ms to allow eyelink to prepare.
+        Starts recording. Waits until the EyeLink reports idle mode before
+        starting, but never longer than ``maxwait``. Each wait is appended to
+        ``self.rwaits``.
 
         :param sendlink: Toggle for sending eye data over the link to the
                          display computer during recording.
         :type sendlink: bool
+        :param maxwait: Longest time in seconds to wait for the EyeLink.
+        :type maxwait: float
         """
 
-        self.tracker.sendCommand('set_idle_mode')
-        time.sleep(.05)
+        self.sendCommand('set_idle_mode')
+        self.rwaits.append(self.waitMode(pylink.IN_IDLE_MODE, maxwait))
         if sendlink:
             self.tracker.startRecording(1, 1, 1, 1)
         else:
             self.tracker.startRecording(1, 1, 0, 0)
+        self.setRecording(True)
+
+    def waitMode(self, mode, maxwait=.05):
+        """
+        Polls the EyeLink until it is in a certain mode.
+
+        :param mode: pylink mode constant, e.g. ``pylink.IN_IDLE_MODE``.
+        :type mode: int
+        :param maxwait: Longest time in seconds to wait.
+        :type maxwait: float
+        :returns: Seconds waited.
+        :rtype: float
+        """
+
+        start = core.getTime()
+        if not self.realconnect:
+            return 0.0
+
+        while not self.tracker.getCurrentMode() & mode:
+            if core.getTime() - start >= maxwait:
+                break
+            time.sleep(.001)
+
+        return core.getTime() - start
 
     def recordOFF(self):
         """
         Stops recording.
         """
         self.tracker.stopRecording()
+        self.setRecording(False)
         
+    def startStream(self, size=60000):
+        """
+        Starts buffering link samples and events on a background thread. Use
+        with ``recordON(sendlink=True)`` and read gaze from ``self.stream``.
+        The thread shares the lock of ``self.tracker``, so call the tracker
+        through ``self.tracker`` while it runs.
+
+        :param size: Number of rows to keep in the buffer.
+        :type size: int
+        :returns: The running stream.
+        :rtype: stream.gazestream
+        """
+
+        if self.stream is None:
+            self.stream = stream.gazestream(self.tracker, size)
+        self.stream.start()
+
+        return self.stream
+
+    def stopStream(self):
+        """
+        Stops buffering link data. Buffered rows stay readable.
+        """
+
+        if self.stream is not None:
+            self.stream.stop()
+
+    def makeDetector(self, vthresh=30.0, mindur=60.0, eye='r', minsacc=10.0):
+        """
+        Creates an online fixation/saccade detector that hit-tests fixations
+        against the interest areas drawn so far this trial. Feed it rows from
+        ``self.stream``.
+
+        :param vthresh: Saccade velocity threshold in degrees per second.
+        :type vthresh: float
+        :param mindur: Shortest fixation to report in ms.
+        :type mindur: float
+        :param eye: Which eye to use, 'l' or 'r'.
+        :type eye: str
+        :param minsacc: Shortest saccade in ms.
+        :type minsacc: float
+        :rtype: detect.ivt
+        """
+
+        ppd = deg2pix(1, self.win.monitor)
+        det = detect.ivt(ppd, vthresh, mindur, eye, minsacc=minsacc)
+        det.setIA(self.ias)
+
+        return det
+
     def drawIA(self, x, y, size, index, color, name):
         """
         Draws square interest area in EDF and a corresponding filled box on
@@ -163,7 +344,10 @@ class connect(object):
 
         # Send commands
         self.tracker.sendMessage(iamsg)
-        self.tracker.sendCommand(bxmsg)
+        self.sendCommand(bxmsg)
+
+        # Keep for online hit-testing
+        self.ias.append([index, name] + tplf + btrh)
         
     def sendVar(self, name, value):
         """
@@ -181,6 +365,25 @@ class connect(object):
         # Send message
         self.tracker.sendMessage(varmsg)
 
+    def sendVars(self, record, cells):
+        """
+        Sends all of a trial's variables to the EDF file in one burst. The
+        messages are built before the first one is sent.
+
+        :param record: Layout of the trial results.
+        :type record: records.trialrecord
+        :param cells: Results serialized with ``record.serialize``.
+        :type cells: list
+        """
+
+        # Make strings
+        varmsgs = record.messages(cells)
+
+        # Send messages
+        send = self.tracker.sendMessage
+        for varmsg in varmsgs:
+            send(varmsg)
+
     def setTrialResult(self, rval=0, scrcol=0):
         """
         Sends trial result to indiciate trial end in EDF and clears screen on
@@ -196,40 +399,128 @@ class connect(object):
         cscmd = 'clear_screen {}'.format(scrcol)
 
         self.tracker.sendMessage(trmsg)
-        self.tracker.sendCommand(cscmd)
+        self.sendCommand(cscmd)
+
+    def attach(self, obj):
+        """
+        Closes an object, e.g. a ``results.resultswriter``, at the start of
+        endExperiment.
+
+        :param obj: Anything with a ``close`` method.
+        :returns: ``obj``.
+        """
+
+        self.closers.append(obj)
+
+        return obj
 
-    def endExperiment(self, spath):
+    def endExperiment(self, spath, debrief=None, progress=None, retries=3):
         """
-        Closes and transfers the EDF file.
+        Closes attached files, then closes and transfers the EDF file. The
+        transfer runs in the background while a debrief screen is shown.
+        Files that fail to transfer are added to :file:`pending_edfs.json` in
+        ``spath`` and can be fetched later with ``python -m pylinkwrapper
+        pull``. With ``instrument`` the link call timings are saved to
+        :file:`<edfname>_linkstats.csv` in ``spath`` as well.
 
         :param spath: File path of where to save EDF file. Include trailing
                       slash.
         :type spath: str
+        :param debrief: Text to show while the file transfers.
+        :type debrief: str
+        :param progress: Called as ``progress(received)`` with bytes received
+                         so far while the file transfers.
+        :type progress: callable
+        :param retries: Number of attempts before queueing the file.
+        :type retries: int
+        :returns: The finished transfer, None in dummy mode where there is no
+                  EDF to transfer.
+        :rtype: transfer.edftransfer
         """
 
+        # Close results files first, they matter most
+        for obj in self.closers:
+            obj.close()
+        self.closers = []
+
+        # Log how long recordON waited for the EyeLink
+        if self.rwaits:
+            wtxt = 'RECORD_WAIT n {} total {:.1f} max {:.1f} ms'.format(
+                len(self.rwaits), sum(self.rwaits) * 1000,
+                max(self.rwaits) * 1000)
+            self.tracker.sendMessage(wtxt)
+
+        # Log link call latencies
+        if self.stats is not None:
+            for stmsg in self.stats.messages():
+                self.tracker.sendMessage(stmsg)
+            self.stats.writeCSV(spath + self.edfname[:-4] + '_linkstats.csv')
+
         # File transfer and cleanup!
         self.tracker.setOfflineMode()
-        time.sleep(.5)
+        self.setRecording(False)
+        self.waitMode(pylink.IN_IDLE_MODE, .5)
+
+        # Close the file
+        self.tracker.closeDataFile()
+
+        # Dummy mode has no file, so nothing to transfer or queue
+        if not self.realconnect:
+            self.tracker.close()
+            return None
 
         # Generate file path
         fpath = spath + self.edfname
+        qpath = spath + 'pending_edfs.json'
 
-        # Close the file and transfer it to Display PC
-        self.tracker.closeDataFile()
-        time.sleep(1)
-        self.tracker.receiveDataFile(self.edfname, fpath)
+        # Transfer it to Display PC
+        xfer = transfer.edftransfer(self.tracker, self.edfname, fpath,
+                                    retries, qpath).start()
+
+        # Keep the display alive while waiting
+        if debrief is not None:
+            dbtxt = visual.TextStim(self.win, debrief, color=-1)
+
+        def update(received):
+            if debrief is not None:
+                dbtxt.draw()
+                self.win.flip()
+            if progress is not None:
+                progress(received)
+
+        xfer.wait(update)
         self.tracker.close()
 
-    def fixCheck(self, size, ftime, button):
+        return xfer
+
+    def fixCheck(self, size, ftime, button, timeout=None, fallback=True,
+                 dthresh=1.5):
         """
-        Checks that fixation is maintained for certain time.
+        Checks that fixation is maintained for certain time. Polls the link at
+        the tracker sample rate and only evaluates samples that have not been
+        seen before.
 
         :param size: Length of one side of box in degrees visual angle.
         :type size: float or int
         :param ftime: Length of time to check for fixation in seconds.
         :type ftime: int
-        :param button: Key to press to recalibrate eye-tracker.
+        :param button: Key to press to drift correct the eye-tracker. Large
+                       drift falls back to a full calibration.
         :type button: char
+        :param timeout: Seconds to wait for fixation before giving up. None
+                        waits forever.
+        :type timeout: float or None
+        :param fallback: Run a drift correction when the check times out.
+        :type fallback: bool
+        :param dthresh: Largest drift in degrees that is corrected without
+                        recalibrating, see ``driftCorrect``.
+        :type dthresh: float
+        :returns: Dictionary with time to acquire fixation in seconds
+                  (``acquire``), number of times the fixation clock was reset
+                  (``resets``), number of new samples checked (``samples``),
+                  how the check ended (``outcome``) and the drift in degrees
+                  if a drift correction was run (``drift``).
+        :rtype: dict
         """
 
         # Calculate Fix check borders
@@ -244,47 +535,146 @@ class connect(object):
         self.setStatus('Fixation Check')
         bxmsg = 'draw_box {} {} {} {} 1'.format(xbdr[0], ybdr[0], xbdr[1],
                                                 ybdr[1])
-        self.tracker.sendCommand(bxmsg)
-        
+        self.sendCommand(bxmsg)
+
         # Begin recording
         self.tracker.startRecording(0, 0, 1, 1)
-        
+        self.setRecording(True)
+
         # Check which eye is being recorded
         eye_used = self.tracker.eyeAvailable()
         RIGHT_EYE = 1
-        LEFT_EYE = 0
-        
-        # Begin polling
-        keys = []
-        fixtime = time.clock()
+
+        # Begin polling once per sample
+        stats = {'acquire': 0.0, 'resets': 0, 'samples': 0,
+                 'outcome': 'dummy', 'drift': None}
+        period = 1.0 / self.srate
+        lastts = None
+        inbox = False
+        start = core.getTime()
+        fixtime = start
+        nxtpoll = start
         while self.realconnect:  # only start check loop if real connection
 
-            # Check for recalibration button
-            keys = event.getKeys(button)
-            if keys:
-                self.tracker.stopRecording()
-                self.calibrate()
-                break 
-            
-            # Grab latest sample
+            # Check for drift correction button
+            if event.getKeys(button):
+                self.recordOFF()
+                stats['drift'] = self.driftCorrect(dthresh)
+                stats['outcome'] = 'drift'
+                break
+
+            # Give up after timeout
+            now = core.getTime()
+            if timeout is not None and (now - start) > timeout:
+                self.recordOFF()
+                stats['outcome'] = 'timeout'
+                if fallback:
+                    stats['drift'] = self.driftCorrect(dthresh)
+                break
+
+            # Grab latest sample, skipping ones we've already checked
             sample = self.tracker.getNewestSample()
-            
-            # Extract gaze coordinates
-            if eye_used == RIGHT_EYE:
-                gaze = sample.getRightEye().getGaze()
+            if sample is not None and sample.getTime() != lastts:
+                lastts = sample.getTime()
+                stats['samples'] += 1
+
+                # Extract gaze coordinates
+                if eye_used == RIGHT_EYE:
+                    gaze = sample.getRightEye().getGaze()
+                else:
+                    gaze = sample.getLeftEye().getGaze()
+
+                # Are we in the box?
+                if xbdr[0] < gaze[0] < xbdr[1] and ybdr[0] < gaze[1] < ybdr[1]:
+                    inbox = True
+
+                    # Have we been in the box long enough?
+                    if (now - fixtime) > ftime:
+                        self.recordOFF()
+                        stats['outcome'] = 'fixated'
+                        break
+                else:
+                    # Reset clock if not in box
+                    if inbox:
+                        stats['resets'] += 1
+                        inbox = False
+                    fixtime = now
+
+            # Sleep until the next sample is due
+            nxtpoll += period
+            wait = nxtpoll - core.getTime()
+            if wait > 0:
+                time.sleep(wait)
             else:
-                gaze = sample.getLeftEye().getGaze()
-                
-            # Are we in the box?
-            if xbdr[0] < gaze[0] < xbdr[1] and ybdr[0] < gaze[1] < ybdr[1]:
-                # Have we been in the box long enough?
-                if (time.clock() - fixtime) > ftime:
-                    self.tracker.stopRecording()
-                    break
+                nxtpoll = core.getTime()
+
+        stats['acquire'] = core.getTime() - start
+
+        return stats
+
+    def driftCorrect(self, thresh=1.5):
+        """
+        Runs a single point drift correction at the center of the screen using
+        the psychopy calibration display and applies it. The drift magnitude
+        is sent to the EDF as a ``DRIFT`` message and kept in ``self.drifts``.
+        A full calibration is run instead of applying the correction when the
+        drift is larger than ``thresh``.
+
+        :param thresh: Largest drift in degrees visual angle that is corrected
+                       without recalibrating.
+        :type thresh: float
+        :returns: Drift in degrees visual angle, or None if it could not be
+                  measured.
+        :rtype: float or None
+        """
+
+        if not self.realconnect:
+            return None
+
+        # Use psychopy graphics for the drift correct target
+        pylink.openGraphicsEx(self.calDisplay())
+
+        # Drift correct, allowing setup if correction fails
+        cenX = int(self.sres[0] / 2.0)
+        cenY = int(self.sres[1] / 2.0)
+        err = self.tracker.doDriftCorrect(cenX, cenY, 1, 1)
+        self.resync()
+
+        # Escape from the target goes to setup, which already recalibrated
+        if err == 27:
+            self.drifts.append(None)
+            self.sendMessage('DRIFT setup')
+            return None
+
+        drift = self._driftSize(self.tracker.getCalibrationMessage())
+        self.drifts.append(drift)
+
+        if drift is not None and drift > thresh:
+            self.sendMessage('DRIFT {:.2f} deg recalibrate'.format(drift))
+            self.calibrate()
+        else:
+            self.tracker.applyDriftCorrect()
+            if drift is None:
+                self.sendMessage('DRIFT NA applied')
             else:
-                # Reset clock if not in box
-                fixtime = time.clock()
-                
+                self.sendMessage('DRIFT {:.2f} deg applied'.format(drift))
+
+        return drift
+
+    def _driftSize(self, calmsg):
+        # Drift in degrees from the host result, e.g.
+        # 'DRIFTCORRECT R RIGHT at 960,540 OFFSET 0.37 deg. 12.2,6.3 pix.'
+        pix = re.search(r'(-?[\d.]+),\s*(-?[\d.]+)\s*pix', calmsg or '')
+        if pix:
+            dx, dy = float(pix.group(1)), float(pix.group(2))
+            return math.hypot(dx, dy) / deg2pix(1, self.win.monitor)
+
+        deg = re.search(r'OFFSET\s+(-?[\d.]+)\s*deg', calmsg or '')
+        if deg:
+            return abs(float(deg.group(1)))
+
+        return None
+
     def sendMessage(self, txt):
         """
         Sends a message to the tracker that is recorded in the EDF.
@@ -296,17 +686,87 @@ class connect(object):
         # Send message
         self.tracker.sendMessage(txt)
         
+    def flipMessage(self, txt, offset=0):
+        """
+        Sends a message at the next window flip. Call before
+        ``window.flip()``; nothing goes over the link until the flip. The
+        message is sent from PsychoPy's flip callback, which runs right after
+        the flip, so its EDF time is the flip plus the callback and link
+        delay. Messages queued for the same flip are written with the EDF
+        time offset convention so they all get the time of the first one.
+
+        :param txt: Message to send.
+        :type txt: str
+        :param offset: Correction in ms for the delay between the flip and the
+                       image appearing, e.g. the display's input lag.
+        :type offset: int
+        """
+
+        if not self.flipq:
+            self.win.callOnFlip(self._flipSend)
+        self.flipq.append((txt, offset))
+
+    def _flipSend(self):
+        # Called by psychopy right after the flip. PsychoPy doesn't hand the
+        # flip timestamp to the callback, so later messages are stamped back
+        # to when the callback started rather than to the flip itself.
+        self.lastflip = core.getTime()
+        queue, self.flipq = self.flipq, []
+        for txt, offset in queue:
+            delay = (core.getTime() - self.lastflip) * 1000.0 - offset
+            self.tracker.sendMessage('{:.0f} {}'.format(delay, txt))
+
     def sendCommand(self, cmd):
         """
-        Sends a command to the Eyelink.
+        Sends a command to the Eyelink. Commands that would not change the
+        mode, status message or display of the EyeLink are dropped and counted
+        in ``self.dropped``.
 
         :param cmd: Command to send.
         :type cmd: str
         """
 
+        # Work out what the command changes
+        key, val = None, None
+        if cmd == 'set_idle_mode':
+            key, val = 'mode', 'idle'
+        elif cmd.startswith('record_status_message'):
+            key, val = 'status', cmd
+        elif cmd.startswith('clear_screen'):
+            key, val = 'screen', cmd
+        elif cmd.startswith('draw_'):
+            self.hstate['screen'] = None
+
+        # Skip if nothing would change
+        if key is not None and self.hstate.get(key) == val:
+            self.dropped += 1
+            return
+
         # Send Command
         self.tracker.sendCommand(cmd)
-        
+        if key is not None:
+            self.hstate[key] = val
+
+    def setRecording(self, recording):
+        """
+        Updates the local copy of host state after recording starts or stops.
+
+        :param recording: Whether the EyeLink is now recording.
+        :type recording: bool
+        """
+
+        self.hstate['recording'] = recording
+        self.hstate['mode'] = 'record' if recording else 'idle'
+
+    def resync(self):
+        """
+        Forgets the local copy of host state so the next commands are always
+        sent, e.g. after the EyeLink was controlled from the host PC.
+        """
+
+        self.hstate = {'mode': None, 'status': None, 'screen': None,
+                       'recording': False}
+
     def drawText(self, msg):
         """
         Draws text on eye-tracker screen.
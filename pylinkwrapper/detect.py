@@ -0,0 +1,197 @@
+# Online fixation and saccade detection from link samples
+import numpy as np
+import linkconst
+
+
+def hitIA(x, y, rects):
+    """
+    Finds the interest area containing each gaze position. Where areas overlap
+    the one listed first wins.
+
+    :param x: X coordinates in EyeLink pixels.
+    :type x: array_like
+    :param y: Y coordinates in EyeLink pixels.
+    :type y: array_like
+    :param rects: Rectangles as rows of left, top, right, bottom.
+    :type rects: array_like
+    :returns: Index into ``rects`` for each position, -1 where none contain it.
+    :rtype: numpy.ndarray
+    """
+
+    x = np.asarray(x, dtype=float)[:, None]
+    y = np.asarray(y, dtype=float)[:, None]
+    rects = np.asarray(rects, dtype=float).reshape(-1, 4)
+
+    # Test every position against every rectangle at once
+    inside = ((x >= rects[:, 0]) & (x <= rects[:, 2]) &
+              (y >= rects[:, 1]) & (y <= rects[:, 3]))
+    hit = inside.argmax(axis=1)
+    hit[~inside.any(axis=1)] = -1
+
+    return hit
+
+
+class ivt(object):
+    """
+    Incremental velocity threshold (I-VT) detector. Feed it batches of link
+    rows with ``update`` and it returns the fixations and saccades that ended
+    within that batch.
+
+    Velocity comes from the EyeLink 5 sample model, the movement between the
+    two samples after and the two before each sample, so a single noisy
+    sample does not end a fixation. Each sample is classified once the two
+    after it have arrived. Runs above the threshold shorter than ``minsacc``
+    are treated as part of the fixation around them.
+
+    :param ppd: Pixels per degree visual angle.
+    :type ppd: float
+    :param vthresh: Velocity threshold for saccades in degrees per second.
+    :type vthresh: float
+    :param mindur: Shortest fixation to report in ms.
+    :type mindur: float
+    :param eye: Which eye to use, 'l' or 'r'.
+    :type eye: str
+    :param gapmax: Sample gaps longer than this (ms), e.g. blinks, end the
+                   current fixation.
+    :type gapmax: float
+    :param minsacc: Shortest saccade in ms.
+    :type minsacc: float
+    """
+
+    def __init__(self, ppd, vthresh=30.0, mindur=60.0, eye='r', gapmax=50.0,
+                 minsacc=10.0):
+        self.ppd = float(ppd)
+        self.vthresh = vthresh
+        self.mindur = mindur
+        self.gapmax = gapmax
+        self.minsacc = minsacc
+        self.xf = eye + 'x'
+        self.yf = eye + 'y'
+
+        # Interest areas
+        self.rects = np.zeros((0, 4))
+        self.names = []
+
+        self.reset()
+
+    def reset(self, onset=None):
+        """
+        Clears detector state, e.g. at the start of a trial.
+
+        :param onset: Tracker time (ms) of stimulus onset used for first
+                      fixation latencies.
+        :type onset: float
+        """
+
+        self.tail = (np.zeros(0), np.zeros(0), np.zeros(0))
+        self.infix = False
+        self.start = None
+        self.pend = None
+        self.fsum = [0.0, 0.0, 0]
+        self.onset = onset
+        self.firsthit = {}
+
+    def setIA(self, ias):
+        """
+        Sets interest areas to hit-test fixations against.
+
+        :param ias: Interest areas as (index, name, left, top, right, bottom),
+                    as kept in ``connect.ias``.
+        :type ias: list
+        """
+
+        self.names = [ia[1] for ia in ias]
+        self.rects = np.array([ia[2:6] for ia in ias],
+                              dtype=float).reshape(-1, 4)
+
+    def update(self, rows):
+        """
+        Processes a batch of rows from ``gazestream``.
+
+        :param rows: Structured array with time, gaze and etype fields.
+        :returns: List of event dictionaries in order of ending.
+        :rtype: list
+        """
+
+        # Keep valid samples only
+        rows = rows[rows['etype'] == linkconst.SAMPLE_TYPE]
+        t = rows['time'].astype(float)
+        x = rows[self.xf].astype(float)
+        y = rows[self.yf].astype(float)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        if not valid.any():
+            return []
+
+        # Carry over the last four samples, the first two already classified
+        t = np.r_[self.tail[0], t[valid]]
+        x = np.r_[self.tail[1], x[valid]]
+        y = np.r_[self.tail[2], y[valid]]
+        self.tail = (t[-4:], x[-4:], y[-4:])
+        if len(t) < 5:
+            return []
+
+        # 5 sample velocity in deg/s, (n+2 + n+1 - n-1 - n-2) / 6 samples
+        dx = x[4:] + x[3:-1] - x[1:-3] - x[:-4]
+        dy = y[4:] + y[3:-1] - y[1:-3] - y[:-4]
+        dt = t[4:] + t[3:-1] - t[1:-3] - t[:-4]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vel = np.hypot(dx, dy) / self.ppd / (dt / 1000.0)
+
+        # Windows spanning a gap never count as fixation
+        gap = np.diff(t) > self.gapmax
+        brk = gap[:-3] | gap[1:-2] | gap[2:-1] | gap[3:]
+        fix = (vel < self.vthresh) & ~brk
+        t, x, y = t[2:-2], x[2:-2], y[2:-2]
+
+        # Walk runs of the same classification
+        events = []
+        edges = np.flatnonzero(np.diff(fix.astype(np.int8))) + 1
+        bounds = np.r_[0, edges, len(fix)]
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            if fix[a]:
+                if not self.infix:
+                    if self.start is not None:
+                        events.append({'type': 'saccade',
+                                       'start': self.start, 'end': t[a]})
+                    self.infix = True
+                    self.start = t[a]
+                    self.fsum = [0.0, 0.0, 0]
+
+                # A short run above threshold was noise, keep fixating
+                self.pend = None
+                self.fsum[0] += x[a:b].sum()
+                self.fsum[1] += y[a:b].sum()
+                self.fsum[2] += b - a
+            elif self.infix:
+                # Fixation ends once the run is long enough to be a saccade
+                if self.pend is None:
+                    self.pend = t[a]
+                if brk[a:b].any() or t[b - 1] - self.pend >= self.minsacc:
+                    self._endfix(self.pend, events)
+                    self.start = self.pend
+                    self.pend = None
+                    self.infix = False
+            elif self.start is None:
+                self.start = t[a]
+
+        # Hit-test all fixations from this batch in one pass
+        fixes = [ev for ev in events if ev['type'] == 'fixation']
+        if fixes and len(self.names):
+            hits = hitIA([ev['x'] for ev in fixes], [ev['y'] for ev in fixes],
+                         self.rects)
+            for ev, hit in zip(fixes, hits):
+                ev['ia'] = self.names[hit] if hit >= 0 else None
+                if ev['ia'] is not None and ev['ia'] not in self.firsthit:
+                    if self.onset is not None:
+                        self.firsthit[ev['ia']] = ev['start'] - self.onset
+                    else:
+                        self.firsthit[ev['ia']] = ev['start']
+
+        return events
+
+    def _endfix(self, end, events):
+        # Report fixation if long enough
+        if end - self.start >= self.mindur and self.fsum[2]:
+            events.append({'type': 'fixation', 'start': self.start,
+                           'end': end, 'x': self.fsum[0] / self.fsum[2],
+                           'y': self.fsum[1] / self.fsum[2], 'ia': None})
@@ -0,0 +1,25 @@
+# pylink constants, with the same values when pylink isn't installed so the
+# link buffer, detectors and simulator run on any machine
+try:
+    from pylink import (SAMPLE_TYPE, STARTFIX, ENDFIX, STARTSACC, ENDSACC,
+                        STARTBLINK, ENDBLINK, MISSING_DATA, LEFT_EYE,
+                        RIGHT_EYE, BINOCULAR, IN_IDLE_MODE, IN_RECORD_MODE)
+except ImportError:
+    # Data types
+    SAMPLE_TYPE = 200
+    STARTBLINK = 3
+    ENDBLINK = 4
+    STARTSACC = 5
+    ENDSACC = 6
+    STARTFIX = 7
+    ENDFIX = 8
+    MISSING_DATA = -32768
+
+    # Eyes
+    LEFT_EYE = 0
+    RIGHT_EYE = 1
+    BINOCULAR = 2
+
+    # Tracker modes, bit flags
+    IN_IDLE_MODE = 1
+    IN_RECORD_MODE = 4
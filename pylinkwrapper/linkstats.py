@@ -0,0 +1,148 @@
+# Timing of link calls
+import csv
+from timeit import default_timer
+import numpy as np
+
+# Calls timed unless told otherwise
+METHODS = ('sendMessage', 'sendCommand', 'startRecording', 'stopRecording',
+           'getNewestSample')
+
+# Histogram bin edges in seconds, 1 us to 1 s
+BINS = np.logspace(-6, 0, 25)
+
+
+class linkstats(object):
+    """
+    Wraps a pylink EyeLink object and times calls to selected methods. Each
+    call stores a method id, trial number and duration in preallocated arrays,
+    so timing adds little more than two clock reads per call. Everything else
+    is passed through to the tracker untouched.
+
+    :param tracker: pylink EyeLink object (or stand-in) to wrap.
+    :param methods: Names of the methods to time.
+    :type methods: list
+    :param size: Number of calls that can be stored.
+    :type size: int
+    """
+
+    def __init__(self, tracker, methods=METHODS, size=500000):
+        self.tracker = tracker
+        self.methods = list(methods)
+
+        # Preallocated call log
+        self.meth = np.zeros(size, dtype=np.int8)
+        self.trial = np.zeros(size, dtype=np.int32)
+        self.dur = np.zeros(size, dtype=np.float32)
+        self.n = 0
+        self.lost = 0
+        self.tnum = 0
+
+        # Replace timed methods with wrappers
+        for mid, name in enumerate(self.methods):
+            setattr(self, name, self._timed(mid, getattr(tracker, name)))
+
+    def __getattr__(self, name):
+        # Anything not timed goes straight to the tracker
+        return getattr(self.tracker, name)
+
+    def _timed(self, mid, func):
+        def call(*args, **kwargs):
+            start = default_timer()
+            ret = func(*args, **kwargs)
+            dur = default_timer() - start
+
+            i = self.n
+            if i < len(self.dur):
+                self.meth[i] = mid
+                self.trial[i] = self.tnum
+                self.dur[i] = dur
+                self.n = i + 1
+            else:
+                self.lost += 1
+
+            return ret
+
+        return call
+
+    def newTrial(self):
+        """
+        Starts attributing calls to the next trial.
+        """
+
+        self.tnum += 1
+
+    def summary(self, trial=None):
+        """
+        Summarises call latencies per method.
+
+        :param trial: Trial number to summarise. None covers the session.
+        :type trial: int
+        :returns: Dictionary of method name to a dictionary with ``n``,
+                  ``mean``, ``p50``, ``p95`` and ``max`` in ms and ``hist``,
+                  counts in ``BINS``.
+        :rtype: dict
+        """
+
+        meth = self.meth[:self.n]
+        dur = self.dur[:self.n]
+        if trial is not None:
+            keep = self.trial[:self.n] == trial
+            meth, dur = meth[keep], dur[keep]
+
+        summ = {}
+        for mid, name in enumerate(self.methods):
+            d = dur[meth == mid]
+            if not len(d):
+                continue
+            ms = d * 1000.0
+            summ[name] = {'n': len(d), 'mean': float(ms.mean()),
+                          'p50': float(np.percentile(ms, 50)),
+                          'p95': float(np.percentile(ms, 95)),
+                          'max': float(ms.max()),
+                          'hist': np.histogram(d, BINS)[0]}
+
+        return summ
+
+    def messages(self):
+        """
+        Formats the session summary as EDF messages.
+
+        :rtype: list
+        """
+
+        msgs = []
+        summ = self.summary()
+        for name in self.methods:
+            if name in summ:
+                s = summ[name]
+                msgs.append('LINKSTAT {} n {} mean {:.3f} p50 {:.3f} p95 {:.3f}'
+                            ' max {:.3f}'.format(name, s['n'], s['mean'],
+                                                 s['p50'], s['p95'], s['max']))
+        if self.lost:
+            msgs.append('LINKSTAT lost {}'.format(self.lost))
+
+        return msgs
+
+    def writeCSV(self, path):
+        """
+        Writes per trial and session summaries to a CSV file. Session rows have
+        trial 'all'. Latencies are in ms.
+
+        :param path: File to write.
+        :type path: str
+        """
+
+        cols = ['n', 'mean', 'p50', 'p95', 'max']
+        with open(path, 'wb') as sf:
+            out = csv.writer(sf)
+            out.writerow(['trial', 'method'] + cols +
+                         ['hist_{:.0e}'.format(b) for b in BINS[1:]])
+            trials = np.unique(self.trial[:self.n]).tolist() + [None]
+            for tnum in trials:
+                summ = self.summary(tnum)
+                for name in self.methods:
+                    if name not in summ:
+                        continue
+                    s = summ[name]
+                    out.writerow(['all' if tnum is None else tnum, name] +
+                                 [s[c] for c in cols] + s['hist'].tolist())
@@ -0,0 +1,207 @@
+# Interest area metrics for whole sessions
+import numpy as np
+import spatial
+
+# One row per interest area of every trial. Times are in ms, dwell sums
+# fixation end - start and first is from stimulus onset, NaN when the area
+# was never fixated.
+MDTYPE = np.dtype([('trial', 'i4'), ('index', 'i4'), ('dwell', 'f8'),
+                   ('nfix', 'i4'), ('first', 'f8')])
+
+# One row per trial. firstia is the row in the metrics table of the first
+# fixated area, -1 if none was fixated.
+FDTYPE = np.dtype([('trial', 'i4'), ('onset', 'f8'), ('firstia', 'i8'),
+                   ('firsttime', 'f8')])
+
+
+def _table(session, name):
+    # Parsed dictionaries and sample stores hold the same tables
+    if isinstance(session, dict):
+        return session[name]
+
+    return getattr(session, name)
+
+
+def category(names):
+    """
+    Gets the category of interest area names, the part before the first '.',
+    e.g. 'target' for 'target.can_1'.
+
+    :param names: IA names.
+    :type names: array_like
+    :returns: Category per name.
+    :rtype: numpy.ndarray
+    """
+
+    names = np.asarray(names)
+
+    return np.array([n.split(b'.' if isinstance(n, bytes) else '.', 1)[0]
+                     for n in names], dtype=names.dtype)
+
+
+def onsets(session, msg=b'stimonset'):
+    """
+    Gets the stimulus onset of each trial from the ``flipMessage`` message,
+    or the recording start where a trial has none.
+
+    :param session: ``ascparse.parse`` output or a ``store.samplestore``.
+    :param msg: Onset message text.
+    :type msg: bytes
+    :returns: Onset time per trial in ms.
+    :rtype: numpy.ndarray
+    """
+
+    trials = _table(session, 'trials')
+    msgs = _table(session, 'msgs')
+
+    onset = trials['start'].copy()
+    hit = msgs[(msgs['text'] == msg) & (msgs['trial'] >= 0)]
+    onset[hit['trial']] = hit['time']
+
+    return onset
+
+
+def iaindex(ias, ntrials):
+    """
+    Lays out a session's interest areas as one padded rectangle array per
+    trial, so fixations can be matched against their own trial's areas with
+    array operations.
+
+    :param ias: ``ias`` table, grouped by trial.
+    :type ias: numpy.ndarray
+    :param ntrials: Number of trials.
+    :type ntrials: int
+    :returns: Rectangles as (trials, areas, 4) with NaN padding, and the row
+              of ``ias`` per slot (-1 for padding).
+    :rtype: tuple
+    """
+
+    first = np.searchsorted(ias['trial'], ias['trial'])
+    slot = np.arange(len(ias)) - first
+    nslot = slot.max() + 1 if len(ias) else 0
+
+    rects = np.full((ntrials, nslot, 4), np.nan)
+    rects[ias['trial'], slot] = np.column_stack([ias['l'], ias['t'],
+                                                 ias['r'], ias['b']])
+    rows = np.full((ntrials, nslot), -1, dtype=np.int64)
+    rows[ias['trial'], slot] = np.arange(len(ias))
+
+    return rects, rows
+
+
+def fixations(session):
+    """
+    Gets a session's fixations with the trial each belongs to.
+
+    :param session: ``ascparse.parse`` output or a ``store.samplestore``.
+    :returns: Fixation events and their trial numbers.
+    :rtype: tuple
+    """
+
+    events = _table(session, 'events')
+    trials = _table(session, 'trials')
+
+    evtrial = np.full(len(events), -1, dtype=np.int32)
+    count = trials['elast'] - trials['efirst']
+    idx = np.repeat(trials['efirst'], count) + (
+        np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count))
+    evtrial[idx] = np.repeat(np.arange(len(trials)), count)
+
+    keep = (events['etype'] == b'F') & (evtrial >= 0)
+
+    return events[keep], evtrial[keep]
+
+
+def hitrows(fix, ftrial, rects, rows, block=100000):
+    """
+    Finds the interest area of each fixation by testing it against all of
+    its own trial's areas. Where areas overlap the one listed first wins,
+    like ``detect.hitIA``. This is the brute force reference for
+    ``spatial.iagrid``, which is what ``iametrics`` uses.
+
+    :param fix: Fixation events.
+    :param ftrial: Trial number per fixation.
+    :param rects: Rectangles from ``iaindex``.
+    :param rows: Slot rows from ``iaindex``.
+    :param block: Fixations tested at a time.
+    :type block: int
+    :returns: Row of the ``ias`` table per fixation, -1 where none.
+    :rtype: numpy.ndarray
+    """
+
+    hit = np.full(len(fix), -1, dtype=np.int64)
+    if not rects.shape[1]:
+        return hit
+
+    # In blocks to bound the (fixations, areas) temporaries
+    for b in range(0, len(fix), block):
+        ft = ftrial[b:b + block]
+        r = rects[ft]
+        x = fix['x'][b:b + block, None]
+        y = fix['y'][b:b + block, None]
+        inside = ((x >= r[:, :, 0]) & (x <= r[:, :, 2]) &
+                  (y >= r[:, :, 1]) & (y <= r[:, :, 3]))
+        part = rows[ft, inside.argmax(axis=1)]
+        part[~inside.any(axis=1)] = -1
+        hit[b:b + block] = part
+
+    return hit
+
+
+def iametrics(session, msg=b'stimonset', skip=(b'fixation', b'pfixation')):
+    """
+    Computes dwell time, fixation count and time to first fixation for every
+    interest area of every trial, and the first fixated area of each trial,
+    in one pass over the session's fixations.
+
+    :param session: ``ascparse.parse`` output or a ``store.samplestore``.
+    :param msg: Onset message, see ``onsets``.
+    :type msg: bytes
+    :param skip: Area names that can't be the first fixated area, e.g. the
+                 fixation point the trial starts on.
+    :type skip: tuple
+    :returns: Metrics per area (``MDTYPE``, rows line up with the ``ias``
+              table, so ``category(ias['name'])`` gives each row's
+              category) and per trial (``FDTYPE``).
+    :rtype: tuple
+    """
+
+    trials = _table(session, 'trials')
+    ias = _table(session, 'ias')
+    onset = onsets(session, msg)
+
+    fix, ftrial = fixations(session)
+    grid = spatial.iagrid(ias, len(trials))
+    hit = grid.lookup(ftrial, fix['x'], fix['y'])
+
+    # Fixations that started before onset don't count
+    keep = (hit >= 0) & (fix['start'] >= onset[ftrial])
+    fix, ftrial, hit = fix[keep], ftrial[keep], hit[keep]
+    dur = fix['end'] - fix['start']
+    ftime = fix['start'] - onset[ftrial]
+
+    met = np.zeros(len(ias), dtype=MDTYPE)
+    met['trial'] = ias['trial']
+    met['index'] = ias['index']
+    met['dwell'] = np.bincount(hit, weights=dur, minlength=len(ias))
+    met['nfix'] = np.bincount(hit, minlength=len(ias))
+    first = np.full(len(ias), np.inf)
+    np.minimum.at(first, hit, ftime)
+    first[np.isinf(first)] = np.nan
+    met['first'] = first
+
+    # First fixated area per trial, ignoring the skipped names
+    tmet = np.zeros(len(trials), dtype=FDTYPE)
+    tmet['trial'] = np.arange(len(trials))
+    tmet['onset'] = onset
+    tmet['firstia'] = -1
+    tmet['firsttime'] = np.nan
+    cand = ~np.isin(ias['name'][hit], list(skip))
+    order = np.lexsort((ftime[cand], ftrial[cand]))
+    ct, ch, cf = ftrial[cand][order], hit[cand][order], ftime[cand][order]
+    lead = np.ones(len(ct), dtype=bool)
+    lead[1:] = ct[1:] != ct[:-1]
+    tmet['firstia'][ct[lead]] = ch[lead]
+    tmet['firsttime'][ct[lead]] = cf[lead]
+
+    return met, tmet
@@ -0,0 +1,282 @@
+# Whole study analysis across a process pool
+import csv
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import numpy as np
+import columns
+import metrics
+import pupil
+import records
+import store
+
+# Bump when the per subject outputs change so caches are rebuilt
+VERSION = 3
+
+# Eye data tables saved per subject
+TABLES = ('ias', 'vars', 'iametrics', 'trialmetrics', 'baselines')
+
+
+def discover(datadir, eyedir=None, pattern='*_mindwand_exp2.csv'):
+    """
+    Finds the sessions in a data folder. Each results CSV is paired with
+    :file:`<id>.asc` or :file:`<id>.edf` from ``eyedir`` if there is one, the
+    ASC being preferred as it needs no conversion.
+
+    :param datadir: Folder with the results CSVs, e.g. :file:`data_exp2`.
+    :type datadir: str
+    :param eyedir: Folder with the EDF or ASC files. Defaults to
+                   ``datadir``.
+    :type eyedir: str
+    :param pattern: Results file name pattern.
+    :type pattern: str
+    :returns: Sessions as dictionaries with ``id``, ``csv`` and ``eye``
+              (None without eye data), sorted by id.
+    :rtype: list
+    """
+
+    eyedir = datadir if eyedir is None else eyedir
+    suffix = pattern.lstrip('*')
+
+    sessions = []
+    for path in sorted(glob.glob(os.path.join(datadir, pattern))):
+        sid = os.path.basename(path)[:-len(suffix)]
+        eye = None
+        for ext in ('.asc', '.edf', '.ASC', '.EDF'):
+            cand = os.path.join(eyedir, sid + ext)
+            if os.path.exists(cand):
+                eye = cand
+                break
+        sessions.append({'id': sid, 'csv': path, 'eye': eye})
+
+    return sessions
+
+
+def sessionkey(session):
+    """
+    Hashes everything a subject's results depend on: the input files, the
+    typed columns if there are any, and ``VERSION``.
+
+    :param session: Entry from ``discover``.
+    :type session: dict
+    :rtype: str
+    """
+
+    sha = hashlib.sha1('v{}'.format(VERSION).encode())
+    paths = [session['csv'], session['eye']]
+    cols = colspath(session['csv'])
+    if cols is not None:
+        paths += sorted(glob.glob(os.path.join(cols, '*')))
+    for path in paths:
+        if path is not None:
+            sha.update(store.filehash(path).encode())
+
+    return sha.hexdigest()[:16]
+
+
+# Types of the results columns the experiment scripts write. Columns not
+# listed here, e.g. from older scripts, are read as str so every subject
+# gets the same types.
+TYPES = {'sub': str, 'tcateg': str, 'tnum': int, 'bnum': int, 'tar': bool,
+         'sim': bool, 'resp': str, 'rtype': str, 'rt': float, 'time': float,
+         'tutra': int, 'tuttime': float, 'hunger': int, 'tired': int,
+         'recorder_trial': int}
+
+
+def csvrecord(path, na='NA', types=None):
+    """
+    Reads a results CSV with a fixed ``trialrecord`` built from its header
+    and ``TYPES``, so column types never depend on a subject's values.
+
+    :param path: Results CSV with a header row.
+    :type path: str
+    :param na: Text used for missing values.
+    :type na: str
+    :param types: Column name to type, defaults to ``TYPES``.
+    :type types: dict
+    :returns: The record and the data rows.
+    :rtype: tuple
+    """
+
+    types = TYPES if types is None else types
+    with open(path, 'rb') as cf:
+        rows = list(csv.reader(cf))
+    header, rows = rows[0], rows[1:]
+
+    cols = [(name, types.get(name, str)) for name in header]
+
+    return records.trialrecord(cols, na), rows
+
+
+def colspath(csvpath):
+    """
+    Gets the typed column copy ``results.resultswriter.addColumns`` keeps
+    next to a results CSV.
+
+    :param csvpath: Results CSV.
+    :type csvpath: str
+    :returns: Folder of the columns, None if there isn't one.
+    :rtype: str
+    """
+
+    path = os.path.splitext(csvpath)[0] + '_cols'
+
+    return path if os.path.exists(os.path.join(path, columns.META)) else None
+
+
+def subject(session, cachedir):
+    """
+    Processes one subject into :file:`<cachedir>/<id>_<key>`: the behaviour
+    as a ``columns`` session and, with eye data, the IA table, trial vars,
+    IA and trial metrics and pupil baselines as :file:`.npy` files. Nothing
+    is done if that folder already exists.
+
+    :param session: Entry from ``discover``.
+    :type session: dict
+    :param cachedir: Cache folder.
+    :type cachedir: str
+    :returns: Path of the subject's folder.
+    :rtype: str
+    """
+
+    spath = os.path.join(cachedir, '{}_{}'.format(session['id'],
+                                                  sessionkey(session)))
+    if os.path.isdir(spath):
+        return spath
+
+    tmp = spath + '.tmp{}'.format(os.getpid())
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    # Behaviour, from the typed columns the experiment wrote or else the CSV
+    cols = colspath(session['csv'])
+    if cols is not None:
+        data, meta = columns.load(cols, mmap_mode=None)
+        behav = os.path.join(tmp, 'behav')
+        os.makedirs(behav)
+        for col in meta['columns']:
+            np.save(os.path.join(behav, col['name'] + '.npy'),
+                    data[col['name']])
+        meta['done'] = True
+        with open(os.path.join(behav, columns.META), 'w') as mf:
+            json.dump(meta, mf)
+    else:
+        record, rows = csvrecord(session['csv'])
+        behav = columns.columnwriter(os.path.join(tmp, 'behav'), record)
+        behav.append(rows)
+        behav.close()
+
+    # Eye data, stores are shared between runs
+    if session['eye'] is not None:
+        sstore = store.load(session['eye'], os.path.join(cachedir, 'stores'))
+        iamet, trialmet = metrics.iametrics(sstore)
+        base = pupil.baselines(sstore)[0]
+        tables = {'ias': sstore.ias, 'vars': sstore.vars, 'iametrics': iamet,
+                  'trialmetrics': trialmet, 'baselines': base}
+        for name in TABLES:
+            np.save(os.path.join(tmp, name + '.npy'), tables[name])
+
+    if os.path.isdir(spath):
+        shutil.rmtree(tmp)
+    else:
+        os.rename(tmp, spath)
+
+    return spath
+
+
+def _subject(job):
+    # Pool workers get one tuple
+    return subject(*job)
+
+
+def _withsubject(table, snum):
+    # Copy of a structured array with a leading subject field
+    out = np.zeros(len(table), dtype=[('subject', 'i4')] + table.dtype.descr)
+    out['subject'] = snum
+    for name in table.dtype.names:
+        out[name] = table[name]
+
+    return out
+
+
+def _stack(parts):
+    # Concatenate structured arrays whose text fields differ in width
+    descr = []
+    for i, (name, dtype) in enumerate(parts[0].dtype.descr):
+        kind = np.dtype(dtype)
+        if kind.kind in 'SU':
+            kind = max((p.dtype[name] for p in parts),
+                       key=lambda d: d.itemsize)
+        descr.append((name, kind))
+
+    out = np.zeros(sum(len(p) for p in parts), dtype=descr)
+    start = 0
+    for part in parts:
+        out[start:start + len(part)] = part.astype(descr)
+        start += len(part)
+
+    return out
+
+
+def run(datadir, cachedir=None, eyedir=None, procs=None):
+    """
+    Processes every session in ``datadir`` on a process pool and joins the
+    subjects into group arrays. Subjects whose inputs are unchanged are
+    loaded from the cache, so adding a subject only processes that one.
+
+    :param datadir: Folder with the results CSVs.
+    :type datadir: str
+    :param cachedir: Cache folder. Defaults to :file:`cache` in ``datadir``.
+    :type cachedir: str
+    :param eyedir: Folder with the EDF or ASC files, see ``discover``.
+    :type eyedir: str
+    :param procs: Number of processes. None uses one per CPU.
+    :type procs: int
+    :returns: Dictionary with ``subjects`` (ids, whose positions are the
+              subject numbers), ``behav`` (column arrays from
+              ``columns.concat``), ``levels`` (str column levels),
+              ``behavsubject`` (subject number per behaviour row) and each
+              eye data table with a leading ``subject`` field.
+    :rtype: dict
+    """
+
+    if cachedir is None:
+        cachedir = os.path.join(datadir, 'cache')
+    if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+
+    sessions = discover(datadir, eyedir)
+    jobs = [(sess, cachedir) for sess in sessions]
+    if procs == 1 or len(jobs) < 2:
+        paths = [_subject(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(procs)
+        try:
+            paths = pool.map(_subject, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    # Behaviour, recoded to shared levels
+    bpaths = [os.path.join(path, 'behav') for path in paths]
+    behav, levels = columns.concat(bpaths)
+    nrows = [columns.load(bpath)[1]['rows'] for bpath in bpaths]
+
+    group = {'subjects': [sess['id'] for sess in sessions],
+             'behav': behav, 'levels': levels,
+             'behavsubject': np.repeat(np.arange(len(paths)), nrows)}
+
+    # Eye data tables
+    for name in TABLES:
+        parts = [_withsubject(np.load(os.path.join(path, name + '.npy')),
+                              snum)
+                 for snum, path in enumerate(paths)
+                 if os.path.exists(os.path.join(path, name + '.npy'))]
+        if parts:
+            group[name] = _stack(parts)
+
+    return group
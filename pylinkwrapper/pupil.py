@@ -0,0 +1,208 @@
+# Pupil baselines from the pupil time epochs
+import os
+import numpy as np
+
+# One row per stimulus trial that follows a pupil time epoch. bad is the
+# fraction of baseline samples that were interpolated.
+BDTYPE = np.dtype([('trial', 'i4'), ('ptrial', 'i4'), ('baseline', 'f8'),
+                   ('bad', 'f8')])
+
+
+def _columns(session):
+    # Sample columns and trial table of parsed output or a samplestore
+    if isinstance(session, dict):
+        return session['samples'], session['trials']
+
+    return session.columns, session.trials
+
+
+def sampletrials(trials, nsamp):
+    """
+    Gets the trial of every sample.
+
+    :param trials: ``trials`` table.
+    :type trials: numpy.ndarray
+    :param nsamp: Number of samples in the session.
+    :type nsamp: int
+    :returns: Trial number per sample, -1 outside trials.
+    :rtype: numpy.ndarray
+    """
+
+    seg = np.full(nsamp, -1, dtype=np.int32)
+    count = trials['slast'] - trials['sfirst']
+    idx = np.repeat(trials['sfirst'], count) + (
+        np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count))
+    seg[idx] = np.repeat(np.arange(len(trials)), count)
+
+    return seg
+
+
+def interpolate(time, pupil, seg, pad=50.0):
+    """
+    Replaces blinks and lost samples with straight lines between the good
+    samples on either side, within each trial. A sample is bad if the pupil
+    is 0 or NaN, or it is within ``pad`` ms of such a sample. Bad runs at
+    the start or end of a trial take the nearest good value, and trials
+    without any good samples stay NaN.
+
+    :param time: Sample times in ms.
+    :type time: numpy.ndarray
+    :param pupil: Pupil sizes.
+    :type pupil: numpy.ndarray
+    :param seg: Trial per sample, see ``sampletrials``.
+    :type seg: numpy.ndarray
+    :param pad: Time around each lost sample to also replace, in ms.
+    :type pad: float
+    :returns: Cleaned pupil sizes and the mask of replaced samples.
+    :rtype: tuple
+    """
+
+    time = np.asarray(time, dtype=float)
+    pupil = np.asarray(pupil, dtype=float)
+    n = len(pupil)
+    if not n:
+        return pupil.copy(), np.zeros(0, dtype=bool)
+
+    # Widen the lost samples by pad ms on either side
+    lost = ~(pupil > 0)
+    if pad > 0 and n > 1:
+        step = np.median(np.diff(time))
+        k = int(np.ceil(pad / step)) if step > 0 else 0
+        if k:
+            edge = np.zeros(n + 1, dtype=int)
+            where = np.nonzero(lost)[0]
+            np.add.at(edge, np.maximum(where - k, 0), 1)
+            np.add.at(edge, np.minimum(where + k + 1, n), -1)
+            lost = np.cumsum(edge)[:n] > 0
+
+    # Nearest good sample before and after each sample, in the same trial
+    idx = np.arange(n)
+    prev = np.maximum.accumulate(np.where(lost, -1, idx))
+    nxt = np.minimum.accumulate(np.where(lost, n, idx)[::-1])[::-1]
+    pok = (prev >= 0) & (seg[np.maximum(prev, 0)] == seg)
+    nok = (nxt < n) & (seg[np.minimum(nxt, n - 1)] == seg)
+    prev = np.maximum(prev, 0)
+    nxt = np.minimum(nxt, n - 1)
+
+    clean = pupil.copy()
+    both = lost & pok & nok
+    span = time[nxt[both]] - time[prev[both]]
+    frac = (time[both] - time[prev[both]]) / np.where(span > 0, span, 1)
+    clean[both] = pupil[prev[both]] + frac * (pupil[nxt[both]] -
+                                              pupil[prev[both]])
+    only = lost & pok & ~nok
+    clean[only] = pupil[prev[only]]
+    only = lost & nok & ~pok
+    clean[only] = pupil[nxt[only]]
+    clean[lost & ~pok & ~nok] = np.nan
+
+    return clean, lost
+
+
+def baselines(session, pad=50.0, window=None, maxbad=.5, cache=True):
+    """
+    Computes the pupil baseline of every pupil time epoch and pairs it with
+    the stimulus trial that follows. The baseline is the mean blink
+    interpolated pupil size over the epoch, or its last ``window`` ms.
+    Baselines with more than ``maxbad`` of their samples interpolated are
+    NaN.
+
+    With a ``store.samplestore`` the cleaned pupil trace and the baselines
+    are cached in the store's folder.
+
+    :param session: ``ascparse.parse`` output or a ``store.samplestore``.
+    :param pad: See ``interpolate``.
+    :type pad: float
+    :param window: Length of the baseline window at the end of the epoch in
+                   ms. None uses the whole epoch.
+    :type window: float
+    :param maxbad: Largest fraction of interpolated samples.
+    :type maxbad: float
+    :param cache: Use and fill the store cache.
+    :type cache: bool
+    :returns: Baselines (``BDTYPE``), the cleaned pupil trace and the trial
+              of each sample.
+    :rtype: tuple
+    """
+
+    samples, trials = _columns(session)
+    seg = sampletrials(trials, len(samples['time']))
+
+    # Cached results for these settings
+    cpath = None
+    if cache and not isinstance(session, dict):
+        cpath = os.path.join(session.path, 'pupil_{:g}_{}_{:g}'.format(
+            pad, 'all' if window is None else '{:g}'.format(window), maxbad))
+        if os.path.exists(cpath + '_base.npy'):
+            return (np.load(cpath + '_base.npy'),
+                    np.load(cpath + '_clean.npy', mmap_mode='r'), seg)
+
+    time = np.asarray(samples['time'])
+    clean, lost = interpolate(time, samples['pupil'], seg, pad)
+
+    # Pupil time epochs followed by a stimulus trial
+    ptrial = np.nonzero(trials['pupiltime'][:-1] &
+                        ~trials['pupiltime'][1:])[0]
+    base = np.zeros(len(ptrial), dtype=BDTYPE)
+    base['ptrial'] = ptrial
+    base['trial'] = ptrial + 1
+
+    # Baseline window of every epoch at once
+    inbase = np.isin(seg, ptrial)
+    if window is not None:
+        full = trials['slast'] > trials['sfirst']
+        tend = np.full(len(trials), np.nan)
+        tend[full] = time[trials['slast'][full] - 1]
+        with np.errstate(invalid='ignore'):
+            inbase &= time > tend[seg] - window
+    which = np.searchsorted(ptrial, seg[inbase])
+    num = np.bincount(which, minlength=len(ptrial))
+    good = np.isfinite(clean[inbase])
+    total = np.bincount(which[good], weights=clean[inbase][good],
+                        minlength=len(ptrial))
+    nbad = np.bincount(which, weights=lost[inbase], minlength=len(ptrial))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        base['baseline'] = total / np.bincount(which[good],
+                                               minlength=len(ptrial))
+        base['bad'] = nbad / num
+    base['baseline'][~(base['bad'] <= maxbad)] = np.nan
+
+    if cpath is not None:
+        np.save(cpath + '_clean.npy', clean)
+        np.save(cpath + '_base.npy', base)
+
+    return base, clean, seg
+
+
+def correct(session, mode='subtract', **kwargs):
+    """
+    Baseline corrects the pupil trace of every stimulus trial that follows a
+    pupil time epoch.
+
+    :param session: ``ascparse.parse`` output or a ``store.samplestore``.
+    :param mode: 'subtract' for pupil - baseline, 'divide' for
+                 (pupil - baseline) / baseline.
+    :type mode: str
+    :param kwargs: Passed to ``baselines``.
+    :returns: Corrected pupil per sample of the session, NaN outside
+              corrected trials, and the baselines.
+    :rtype: tuple
+    """
+
+    base, clean, seg = baselines(session, **kwargs)
+
+    # Baseline of every sample's trial, NaN where there is none
+    bytrial = np.full(len(_columns(session)[1]) + 1, np.nan)
+    bytrial[base['trial']] = base['baseline']
+    sbase = bytrial[seg]
+
+    if mode == 'subtract':
+        corr = clean - sbase
+    elif mode == 'divide':
+        corr = (clean - sbase) / sbase
+    else:
+        raise ValueError('Unknown correction mode: {}'.format(mode))
+
+    return corr, base
+
@@ -0,0 +1,102 @@
+# Typed trial result records shared by the CSV and the EDF
+
+
+class trialrecord(object):
+    """
+    Column layout for trial results. Each trial's values are converted to text
+    once with ``serialize`` and the same strings are used for the CSV row and
+    the ``!V TRIAL_VAR`` messages, so both always agree.
+
+    Column types are ``int``, ``float``, ``bool`` or ``str``. Floats are
+    written with ``repr`` unless a format is given, e.g. ``('rt', float,
+    '{:.4f}')``. Missing values (None or ``na``) are written as ``na``.
+
+    :param columns: List of (name, type) or (name, type, format) tuples in
+                    output order.
+    :type columns: list
+    :param na: Text used for missing values.
+    :type na: str
+    """
+
+    def __init__(self, columns, na='NA'):
+        self.na = na
+        self.header = [col[0] for col in columns]
+        self.types = [col[1] for col in columns]
+        self.fmts = [col[2] if len(col) > 2 else None for col in columns]
+        self.convs = [self._converter(t, f)
+                      for t, f in zip(self.types, self.fmts)]
+
+    def _converter(self, ctype, fmt):
+        # Build one text conversion per column
+        if fmt is not None:
+            return lambda v: fmt.format(ctype(v))
+        if ctype is bool:
+            return lambda v: 'True' if v else 'False'
+        if ctype is float:
+            return lambda v: repr(float(v))
+        if ctype is int:
+            return lambda v: str(int(v))
+
+        def text(v):
+            # TRIAL_VAR values can't contain spaces
+            v = v if isinstance(v, str) else str(v)
+            return v.replace(' ', '_')
+
+        return text
+
+    def serialize(self, results):
+        """
+        Converts one trial's results to text in column order.
+
+        :param results: Values keyed by column name.
+        :type results: dict
+        :returns: One string per column.
+        :rtype: list
+        """
+
+        cells = []
+        for name, conv in zip(self.header, self.convs):
+            val = results[name]
+            if val is None or val == self.na:
+                cells.append(self.na)
+            else:
+                cells.append(conv(val))
+
+        return cells
+
+    def messages(self, cells):
+        """
+        Makes the ``!V TRIAL_VAR`` messages for serialized results.
+
+        :param cells: Output of ``serialize``.
+        :type cells: list
+        :rtype: list
+        """
+
+        return ['!V TRIAL_VAR {} {}'.format(name, cell)
+                for name, cell in zip(self.header, cells)]
+
+    def typed(self, cells):
+        """
+        Converts serialized results back to Python values, e.g. when reading
+        the CSV.
+
+        :param cells: Strings in column order.
+        :type cells: list
+        :rtype: list
+        """
+
+        vals = []
+        for ctype, cell in zip(self.types, cells):
+            if cell == self.na:
+                vals.append(None)
+            elif ctype is bool:
+                vals.append(cell == 'True')
+            elif ctype is int:
+                vals.append(int(float(cell)))
+            elif ctype is float:
+                vals.append(float(cell))
+            else:
+                vals.append(cell)
+
+        return vals
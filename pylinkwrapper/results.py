@@ -0,0 +1,203 @@
+# Trial results written to disk off the main thread
+import atexit
+import csv
+import os
+import threading
+from timeit import default_timer
+import columns
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class resultswriter(object):
+    """
+    Drop-in replacement for ``csv.writer(open(path, 'wb'))`` that never makes
+    the experiment wait on the disk. ``writerow`` only adds the row to the
+    current trial's batch. ``endTrial`` hands the batch to a worker thread,
+    which formats it, appends it to the file in one write and syncs it to
+    disk.
+
+    A batch is only handed over once the previous one is on disk, so a crash
+    loses at most the trial being synced and the one in progress. Normally
+    the sync finishes long before the next trial ends and ``endTrial`` returns
+    at once; time spent waiting anyway is kept in ``waits``.
+
+    Rows can also be kept as typed NumPy columns, see ``addColumns``, and
+    passed on as they are written, see ``addListener``.
+
+    The file is closed by ``close``, which commits anything left in the batch.
+    ``close`` is also registered with ``atexit`` so ``core.quit`` closes it,
+    and ``connect.attach`` closes it in ``endExperiment``.
+
+    :param path: CSV file to write.
+    :type path: str
+    :param header: Optional first row.
+    :type header: list
+    """
+
+    def __init__(self, path, header=None):
+        self.path = path
+        self.batch = []
+        self.colbatch = []
+        self.colwriter = None
+        self.listeners = []
+        self.rows = 0
+        self.waits = []
+        self.error = None
+        self.closed = False
+
+        pdir = os.path.dirname(path)
+        if pdir and not os.path.isdir(pdir):
+            os.makedirs(pdir)
+        self.file = open(path, 'wb')
+
+        # Worker thread
+        self.queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work,
+                                        name='resultswriter')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+        if header is not None:
+            self.writerow(header)
+            self.endTrial()
+
+    def writerow(self, row):
+        """
+        Adds a row to the current trial's batch.
+
+        :param row: Values in column order.
+        :type row: list
+        """
+
+        self.batch.append(list(row))
+        if self.colwriter is not None:
+            self.colbatch.append(self.batch[-1])
+        for record, func in self.listeners:
+            func(dict(zip(record.header, record.typed(row))))
+
+    def addColumns(self, record, path=None):
+        """
+        Also writes every following row to a ``columns.columnwriter``, e.g.
+        after the header row has been written. Rows must be serialized with
+        ``record``.
+
+        :param record: Column layout of the rows.
+        :type record: records.trialrecord
+        :param path: Folder for the columns. Defaults to the CSV path with
+                     ``_cols`` in place of the extension.
+        :type path: str
+        :returns: The column writer.
+        :rtype: columns.columnwriter
+        """
+
+        if path is None:
+            path = os.path.splitext(self.path)[0] + '_cols'
+        self.colwriter = columns.columnwriter(path, record)
+
+        return self.colwriter
+
+    def addListener(self, record, func):
+        """
+        Calls ``func`` with every following row as a dictionary of typed
+        values, e.g. ``sdt.sdtengine.update`` for live summaries. Runs on the
+        calling thread, so keep it quick.
+
+        :param record: Column layout of the rows.
+        :type record: records.trialrecord
+        :param func: Called as ``func(row)``.
+        :type func: callable
+        """
+
+        self.listeners.append((record, func))
+
+    def writerows(self, rows):
+        """
+        Adds several rows to the current trial's batch.
+
+        :param rows: List of rows.
+        :type rows: list
+        """
+
+        for row in rows:
+            self.writerow(row)
+
+    def endTrial(self):
+        """
+        Commits the current batch. Waits only if the previous batch is not
+        on disk yet.
+        """
+
+        if self.closed:
+            raise ValueError('resultswriter is closed: {}'.format(self.path))
+        if self.error is not None:
+            raise self.error
+        if not self.batch:
+            return
+
+        # Previous trial must be on disk first
+        start = default_timer()
+        self.queue.join()
+        wait = default_timer() - start
+        if wait > .001:
+            self.waits.append(wait)
+
+        self.queue.put((self.batch, self.colbatch))
+        self.rows += len(self.batch)
+        self.batch = []
+        self.colbatch = []
+
+    def flush(self):
+        """
+        Commits the current batch and blocks until it is on disk.
+        """
+
+        self.endTrial()
+        self.queue.join()
+
+    def close(self):
+        """
+        Commits anything left, stops the worker and closes the file. Safe to
+        call more than once.
+        """
+
+        if self.closed:
+            return
+        if self.batch and self.error is None:
+            self.endTrial()
+        self.closed = True
+        self.queue.put(None)
+        self._thread.join()
+        self.file.close()
+        if self.colwriter is not None:
+            self.colwriter.close()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+
+            batch, colbatch = item
+            try:
+                buff = StringIO()
+                csv.writer(buff).writerows(batch)
+                self.file.write(buff.getvalue())
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                if colbatch:
+                    self.colwriter.append(colbatch)
+            except Exception as err:
+                # Raised on the next endTrial
+                self.error = err
+            self.queue.task_done()
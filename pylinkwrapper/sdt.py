@@ -0,0 +1,351 @@
+# Signal detection and RT summaries that update trial by trial
+import math
+import numpy as np
+import columns
+
+# Response types counted by sdtacc
+RTYPES = ('hi', 'mi', 'fa', 'cr')
+
+
+# Rational approximation of the normal quantile (Acklam), see _ppf
+_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+      1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+      6.680131188771972e+01, -1.328068155288572e+01, 1.0)
+_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+      -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+      3.754408661907416e+00, 1.0)
+
+
+def _poly(coefs, x):
+    total = 0.0
+    for coef in coefs:
+        total = total * x + coef
+
+    return total
+
+
+def _ppf(p):
+    # Normal quantile, polished with one Halley step to full precision
+    if not 0 < p < 1:
+        return float('nan')
+    if p < .02425:
+        q = math.sqrt(-2 * math.log(p))
+        x = _poly(_C, q) / _poly(_D, q)
+    elif p > 1 - .02425:
+        q = math.sqrt(-2 * math.log(1 - p))
+        x = -_poly(_C, q) / _poly(_D, q)
+    else:
+        q = p - .5
+        x = _poly(_A, q * q) * q / _poly(_B, q * q)
+
+    err = .5 * math.erfc(-x / math.sqrt(2)) - p
+    u = err * math.sqrt(2 * math.pi) * math.exp(x * x / 2)
+
+    return x - u / (1 + x * u / 2)
+
+
+def _value(code, dtype, levels=None):
+    # Python value of a stored column entry, None if missing (columns.KINDS)
+    if dtype == np.int8:
+        return None if code < 0 else bool(code)
+    if dtype == np.int16:
+        return None if code < 0 else levels[code]
+    if dtype.kind == 'f':
+        return None if np.isnan(code) else float(code)
+
+    return None if code == columns.KINDS[int][1] else int(code)
+
+
+class sdtacc(object):
+    """
+    Running counts of hits, misses, false alarms and correct rejections plus
+    RT mean and variance (Welford). Accumulators for separate sets of trials,
+    e.g. subjects or sessions, combine exactly with ``merge``.
+    """
+
+    def __init__(self):
+        self.counts = dict((rtype, 0) for rtype in RTYPES)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, rtype, rt=None):
+        """
+        Adds one trial.
+
+        :param rtype: 'hi', 'mi', 'fa' or 'cr'. Other values are ignored.
+        :type rtype: str
+        :param rt: Response time, or None.
+        :type rt: float
+        """
+
+        if rtype not in self.counts:
+            return
+        self.counts[rtype] += 1
+
+        if rt is not None and not math.isnan(rt):
+            self.n += 1
+            delta = rt - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (rt - self.mean)
+            self.min = min(self.min, rt)
+            self.max = max(self.max, rt)
+
+    def merge(self, other):
+        """
+        Adds another accumulator's trials to this one.
+
+        :param other: Accumulator to add.
+        :type other: sdtacc
+        :returns: self.
+        """
+
+        for rtype in RTYPES:
+            self.counts[rtype] += other.counts[rtype]
+
+        self._combine(other.n, other.mean, other.m2, other.min, other.max)
+
+        return self
+
+    def _combine(self, n, mean, m2, rmin, rmax):
+        # Chan et al. pairwise update of mean and squared deviations
+        if not n:
+            return
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+        self.min = min(self.min, rmin)
+        self.max = max(self.max, rmax)
+
+    def rates(self):
+        """
+        Hit and false alarm rates with the log-linear correction, which
+        adds .5 to each count so rates of 0 and 1 stay finite.
+
+        :returns: Hit rate and false alarm rate.
+        :rtype: tuple
+        """
+
+        c = self.counts
+        hr = (c['hi'] + .5) / (c['hi'] + c['mi'] + 1.0)
+        far = (c['fa'] + .5) / (c['fa'] + c['cr'] + 1.0)
+
+        return hr, far
+
+    def summary(self):
+        """
+        Summarises the trials so far.
+
+        :returns: Dictionary with the counts, ``hr``, ``far``, ``dprime``,
+                  ``c`` (criterion), ``rtn``, ``rtmean``, ``rtsd``,
+                  ``rtmin`` and ``rtmax``. Undefined values are NaN.
+        :rtype: dict
+        """
+
+        summ = dict(self.counts)
+        hr, far = self.rates()
+        zhr, zfar = _ppf(hr), _ppf(far)
+        summ.update({'hr': hr, 'far': far, 'dprime': zhr - zfar,
+                     'c': -(zhr + zfar) / 2.0, 'rtn': self.n,
+                     'rtmean': self.mean if self.n else float('nan'),
+                     'rtsd': math.sqrt(self.m2 / (self.n - 1))
+                     if self.n > 1 else float('nan'),
+                     'rtmin': self.min if self.n else float('nan'),
+                     'rtmax': self.max if self.n else float('nan')})
+
+        return summ
+
+
+class sdtengine(object):
+    """
+    Keeps an ``sdtacc`` for all trials and for every level of each key
+    column, e.g. per block, similar vs random foils and TUT rating. Feed it
+    rows live with ``update`` (see ``results.resultswriter.addListener``) or
+    offline from stored columns with ``addColumns``. Engines with the same
+    keys merge, so subject engines add up to a group.
+
+    Foil keys split the noise trials only: signal trials (hits and misses)
+    count towards every listed level, so each level's d' compares all targets
+    with that kind of foil. Carry keys are filled in backwards, a row missing
+    the value takes it from the next row that has one, e.g. a TUT rating
+    that covers the trials since the last probe. Rows after the last value
+    don't count towards any level of that key.
+
+    :param keys: Columns to split by.
+    :type keys: tuple
+    :param foils: Foil key columns and their levels, e.g.
+                  ``{'sim': (True, False)}``.
+    :type foils: dict
+    :param carry: Keys to fill in backwards.
+    :type carry: tuple
+    """
+
+    def __init__(self, keys=('bnum', 'tutra'), foils=None, carry=('tutra',)):
+        self.keys = tuple(keys)
+        self.foils = dict(foils if foils is not None else
+                          {'sim': (True, False)})
+        self.carry = tuple(carry)
+        self.accs = {('all', None): sdtacc()}
+
+        # Trials waiting for a carry key value, as (rtype, rt)
+        self.held = dict((key, []) for key in self.carry)
+
+    def _acc(self, key, level):
+        acc = self.accs.get((key, level))
+        if acc is None:
+            acc = self.accs[(key, level)] = sdtacc()
+
+        return acc
+
+    def update(self, row):
+        """
+        Adds one trial.
+
+        :param row: Values keyed by column name, with at least ``rtype`` and
+                    ``rt``. Rows with missing key values only count towards
+                    the levels they have.
+        :type row: dict
+        """
+
+        rtype, rt = row.get('rtype'), row.get('rt')
+        self.accs[('all', None)].add(rtype, rt)
+        for key in self.keys:
+            level = row.get(key)
+            if key in self.held:
+                if level is None:
+                    self.held[key].append((rtype, rt))
+                    continue
+                for held in self.held[key]:
+                    self._acc(key, level).add(*held)
+                self.held[key] = []
+            if level is not None:
+                self._acc(key, level).add(rtype, rt)
+
+        for key, flevels in self.foils.items():
+            level = row.get(key)
+            if rtype in ('hi', 'mi'):
+                for flevel in flevels:
+                    self._acc(key, flevel).add(rtype, rt)
+            elif level in flevels:
+                self._acc(key, level).add(rtype, rt)
+
+    def addColumns(self, data, levels=None):
+        """
+        Adds trials from column arrays as written by ``columns.columnwriter``,
+        e.g. from ``columns.load``, ``columns.concat`` or ``pipeline.run``.
+        Counts and RT moments are computed per level with NumPy and merged
+        in, and levels come out as the same values ``update`` sees.
+
+        :param data: Dictionary of column name to array.
+        :type data: dict
+        :param levels: Levels of the str columns, needed for ``rtype`` and
+                       any str keys.
+        :type levels: dict
+
+        Carry keys are filled in within ``data``, so pass one subject at a
+        time unless every subject's last row has a value.
+        """
+
+        levels = levels or {}
+        rtype = np.asarray(data['rtype'])
+        if rtype.dtype == np.int16:
+            names = np.array(list(levels['rtype']) + [None], dtype=object)
+            rtype = names[np.where(rtype < 0, len(levels['rtype']), rtype)]
+        rt = np.asarray(data['rt'], dtype=float)
+        signal = np.isin(rtype, ('hi', 'mi'))
+
+        self._addGroup(('all', None), np.ones(len(rt), dtype=bool), rtype, rt)
+        for key in self.keys + tuple(self.foils):
+            codes, inv = np.unique(np.asarray(data[key]), return_inverse=True)
+            vals = [_value(code, codes.dtype, levels.get(key))
+                    for code in codes]
+
+            if key in self.foils:
+                for flevel in self.foils[key]:
+                    same = np.isin(inv, [i for i, v in enumerate(vals)
+                                         if v == flevel])
+                    self._addGroup((key, flevel), signal | same, rtype, rt)
+                continue
+
+            if key in self.carry:
+                inv = _backfill(inv, [i for i, v in enumerate(vals)
+                                      if v is None])
+            for i, level in enumerate(vals):
+                if level is not None:
+                    self._addGroup((key, level), inv == i, rtype, rt)
+
+    def _addGroup(self, name, mask, rtype, rt):
+        acc = self._acc(*name)
+        sel = rtype[mask]
+        for rname in RTYPES:
+            acc.counts[rname] += int((sel == rname).sum())
+
+        # RT moments of trials with a counted response
+        r = rt[mask & np.isin(rtype, RTYPES)]
+        r = r[~np.isnan(r)]
+        if len(r):
+            mean = r.mean()
+            acc._combine(len(r), mean, ((r - mean) ** 2).sum(), r.min(),
+                         r.max())
+
+    def merge(self, other):
+        """
+        Adds another engine's trials to this one.
+
+        :param other: Engine with the same keys.
+        :type other: sdtengine
+        :returns: self.
+        """
+
+        for name, acc in other.accs.items():
+            self._acc(*name).merge(acc)
+
+        return self
+
+    def summary(self):
+        """
+        Summarises every group.
+
+        :returns: One dictionary per group with ``key`` and ``level`` plus
+                  ``sdtacc.summary``, all trials first.
+        :rtype: list
+        """
+
+        rows = []
+        for (key, level) in sorted(self.accs, key=lambda kl: (
+                kl[0] != 'all', kl[0], str(kl[1]))):
+            summ = self.accs[(key, level)].summary()
+            summ.update({'key': key, 'level': level})
+            rows.append(summ)
+
+        return rows
+
+    def messages(self):
+        """
+        Formats the summary as EDF messages.
+
+        :rtype: list
+        """
+
+        return ['SDT {} {} hi {} mi {} fa {} cr {} dprime {:.3f} c {:.3f} '
+                'rt {:.4f} sd {:.4f}'.format(
+                    s['key'], s['level'], s['hi'], s['mi'], s['fa'], s['cr'],
+                    s['dprime'], s['c'], s['rtmean'], s['rtsd'])
+                for s in self.summary()]
+
+
+def _backfill(inv, missing):
+    # Missing entries take the next present one, -1 after the last
+    inv = inv.copy()
+    gone = np.isin(inv, missing)
+    idx = np.where(gone, len(inv), np.arange(len(inv)))
+    nxt = np.minimum.accumulate(idx[::-1])[::-1]
+    inv[gone] = np.r_[inv, -1][nxt[gone]]
+
+    return inv
@@ -0,0 +1,343 @@
+# Local stand-in for the EyeLink with a link latency model
+import os
+import random
+import shutil
+import time
+import numpy as np
+import linkconst
+
+
+class simeye(object):
+    """
+    Eye data of one simulated sample.
+    """
+
+    def __init__(self, x, y, pupil):
+        self.gaze = (x, y)
+        self.pupil = pupil
+
+    def getGaze(self):
+        return self.gaze
+
+    def getPupilSize(self):
+        return self.pupil
+
+
+class simsample(object):
+    """
+    Simulated sample with the accessors of ``pylink.Sample``.
+    """
+
+    def __init__(self, ts, x, y, pupil, eye):
+        self.ts = ts
+        self.eye = eye
+        self.data = simeye(x, y, pupil)
+
+    def getTime(self):
+        return self.ts
+
+    def isLeftSample(self):
+        return self.eye in (linkconst.LEFT_EYE, linkconst.BINOCULAR)
+
+    def isRightSample(self):
+        return self.eye in (linkconst.RIGHT_EYE, linkconst.BINOCULAR)
+
+    def getLeftEye(self):
+        return self.data
+
+    def getRightEye(self):
+        return self.data
+
+
+class simtracker(object):
+    """
+    Stands in for ``pylink.EyeLink`` so the connector and experiments can run
+    and be timed without the lab. Implements the calls pylinkwrapper makes,
+    sleeping for a simulated link latency on each one. Recording mode changes
+    take ``modedelay`` seconds to show up in ``getCurrentMode``. Messages and
+    samples go to a text file in the EyeLink ASC format inside ``hostdir``,
+    which ``receiveDataFile`` copies out. Binocular samples have the columns
+    time, left x, y, pupil, right x, y, pupil, with the same gaze for both
+    eyes. No events are simulated.
+
+    Pass it to ``connect`` with the ``tracker`` argument.
+
+    :param hostdir: Folder standing in for the host PC's disk.
+    :type hostdir: str
+    :param latency: Mean and standard deviation of link call latency in
+                    seconds.
+    :type latency: tuple
+    :param methlat: Latency overrides per method name, e.g.
+                    ``{'startRecording': (.01, .002)}``.
+    :type methlat: dict
+    :param modedelay: Seconds before a mode change takes effect.
+    :type modedelay: float
+    :param srate: Sampling rate in Hz.
+    :type srate: int
+    :param eye: pylink eye constant of the recorded eye, see ``linkconst``.
+    :type eye: int
+    :param xferrate: Simulated file transfer rate in bytes per second.
+    :type xferrate: float
+    :param scrsize: Display size used for the default gaze position.
+    :type scrsize: tuple
+    :param ppd: Pixels per degree used for drift correction results.
+    :type ppd: float
+    """
+
+    def __init__(self, hostdir, latency=(.0005, .0001), methlat=None,
+                 modedelay=.005, srate=1000, eye=linkconst.RIGHT_EYE,
+                 xferrate=2e6, scrsize=(1920, 1080), ppd=30.0):
+        self.hostdir = hostdir
+        self.latency = latency
+        self.methlat = methlat or {}
+        self.modedelay = modedelay
+        self.srate = srate
+        self.eye = eye
+        self.xferrate = xferrate
+        self.ppd = ppd
+
+        # Call counts per method
+        self.calls = {}
+
+        # Host state
+        self.t0 = time.time()
+        self.mode = linkconst.IN_IDLE_MODE
+        self.nextmode = None
+        self.modeat = 0.0
+        self.recording = False
+        self.filesamp = False
+        self.fileflags = ''
+        self.linksamp = False
+        self.edf = None
+        self.edfname = None
+        self.calmsg = ''
+
+        # Gaze to replay, centre of screen until setGaze is called
+        self.setGaze([scrsize[0] / 2.0], [scrsize[1] / 2.0], [1000.0])
+        self.filek = 0
+        self.linkk = 0
+        self.last = None
+
+        if not os.path.isdir(hostdir):
+            os.makedirs(hostdir)
+
+    # Simulation controls
+    def setGaze(self, x, y, pupil):
+        """
+        Sets gaze data to replay while recording. Sample k of the session uses
+        entry k modulo the array length.
+
+        :param x: Gaze x per sample in EyeLink pixels.
+        :param y: Gaze y per sample in EyeLink pixels.
+        :param pupil: Pupil size per sample.
+        """
+
+        self.gx = np.asarray(x, dtype=float)
+        self.gy = np.asarray(y, dtype=float)
+        self.gp = np.asarray(pupil, dtype=float)
+
+    def _call(self, name):
+        # Count and block like the link would
+        self.calls[name] = self.calls.get(name, 0) + 1
+        mean, sd = self.methlat.get(name, self.latency)
+        delay = random.gauss(mean, sd)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _now(self):
+        return int((time.time() - self.t0) * 1000)
+
+    def _setmode(self, mode):
+        self.nextmode = mode
+        self.modeat = time.time() + self.modedelay
+
+    def _sampleno(self, ts):
+        return int(ts * self.srate / 1000)
+
+    def _gazeat(self, k):
+        i = k % len(self.gx)
+        return self.gx[i], self.gy[i], self.gp[i]
+
+    def _catchup(self):
+        # Write samples recorded since the last write to the file
+        if not (self.recording and self.edf):
+            return
+        last = self._sampleno(self._now())
+        if last <= self.filek:
+            return
+        if not self.filesamp:
+            self.filek = last
+            return
+
+        k = np.arange(self.filek + 1, last + 1)
+        i = k % len(self.gx)
+        gaze = [self.gx[i], self.gy[i], self.gp[i]]
+        if self.eye == linkconst.BINOCULAR:
+            line = '%d\t%.1f\t%.1f\t%.1f\t%.1f\t%.1f\t%.1f\t.....\n'
+            gaze = gaze * 2
+        else:
+            line = '%d\t%.1f\t%.1f\t%.1f\t...\n'
+        cols = np.column_stack([k * 1000.0 / self.srate] + gaze).ravel()
+        self.edf.write((line * len(k)) % tuple(cols))
+        self.filek = last
+
+    def _write(self, line):
+        if self.edf:
+            self._catchup()
+            self.edf.write(line + '\n')
+
+    # pylink.EyeLink subset
+    def getTrackerVersion(self):
+        self._call('getTrackerVersion')
+        return 3
+
+    def openDataFile(self, name):
+        self._call('openDataFile')
+        self.edfname = name
+        self.edf = open(os.path.join(self.hostdir, name), 'w')
+        self.edf.write('** CONVERTED FROM SIMTRACKER {}\n'.format(name))
+        return 0
+
+    def closeDataFile(self):
+        self._call('closeDataFile')
+        if self.edf:
+            self._catchup()
+            self.edf.close()
+            self.edf = None
+        return 0
+
+    def receiveDataFile(self, src, dest):
+        self._call('receiveDataFile')
+        hpath = os.path.join(self.hostdir, src)
+        if self.edf or not os.path.exists(hpath):
+            return -1
+
+        size = os.path.getsize(hpath)
+        time.sleep(size / float(self.xferrate))
+        shutil.copyfile(hpath, dest)
+        return size
+
+    def close(self):
+        self._call('close')
+        if self.edf:
+            self.closeDataFile()
+
+    def sendCommand(self, cmd):
+        self._call('sendCommand')
+        if cmd.strip() == 'set_idle_mode':
+            self._stoprec()
+            self._setmode(linkconst.IN_IDLE_MODE)
+        return 0
+
+    def sendMessage(self, txt):
+        self._call('sendMessage')
+        self._write('MSG\t{} {}'.format(self._now(), txt))
+        return 0
+
+    def setOfflineMode(self):
+        self._call('setOfflineMode')
+        self._stoprec()
+        self._setmode(linkconst.IN_IDLE_MODE)
+
+    def getCurrentMode(self):
+        self._call('getCurrentMode')
+        if self.nextmode is not None and time.time() >= self.modeat:
+            self.mode = self.nextmode
+            self.nextmode = None
+        return self.mode
+
+    def startRecording(self, fsamp, fevent, lsamp, levent):
+        self._call('startRecording')
+        now = self._now()
+        self.recording = True
+        self.filesamp = bool(fsamp)
+        self.linksamp = bool(lsamp)
+        self.filek = self.linkk = self._sampleno(now)
+
+        # The file gets what the flags ask for, e.g. nothing but the START
+        # and END lines from fixCheck's startRecording(0, 0, 1, 1)
+        eyes = {linkconst.LEFT_EYE: 'LEFT', linkconst.RIGHT_EYE: 'RIGHT',
+                linkconst.BINOCULAR: 'LEFT\tRIGHT'}[self.eye]
+        self.fileflags = ('\tSAMPLES' if fsamp else '') + (
+            '\tEVENTS' if fevent else '')
+        self._write('START\t{} {}{}'.format(now, eyes, self.fileflags))
+        self._setmode(linkconst.IN_RECORD_MODE)
+        return 0
+
+    def stopRecording(self):
+        self._call('stopRecording')
+        self._stoprec()
+        self._setmode(linkconst.IN_IDLE_MODE)
+
+    def _stoprec(self):
+        if self.recording:
+            self._catchup()
+            self.recording = False
+            self._write('END\t{} {}'.format(self._now(), self.fileflags))
+
+    def isRecording(self):
+        self._call('isRecording')
+        return 0 if self.recording else 1
+
+    def eyeAvailable(self):
+        self._call('eyeAvailable')
+        return self.eye
+
+    def getNewestSample(self):
+        self._call('getNewestSample')
+        if not self.recording:
+            return None
+        k = self._sampleno(self._now())
+        ts = int(k * 1000.0 / self.srate)
+        return simsample(ts, *(self._gazeat(k) + (self.eye,)))
+
+    def getNextData(self):
+        self._call('getNextData')
+        if not (self.recording and self.linksamp):
+            return 0
+        if self.linkk >= self._sampleno(self._now()):
+            return 0
+
+        self.linkk += 1
+        ts = int(self.linkk * 1000.0 / self.srate)
+        self.last = simsample(ts, *(self._gazeat(self.linkk) + (self.eye,)))
+        return linkconst.SAMPLE_TYPE
+
+    def getFloatData(self):
+        self._call('getFloatData')
+        return self.last
+
+    def setCalibrationType(self, caltype):
+        self._call('setCalibrationType')
+
+    def setAutoCalibrationPacing(self, pace):
+        self._call('setAutoCalibrationPacing')
+
+    def setPupilSizeDiameter(self, val):
+        self._call('setPupilSizeDiameter')
+
+    def doTrackerSetup(self, width=None, height=None):
+        self._call('doTrackerSetup')
+
+    def doDriftCorrect(self, x, y, draw, allow_setup):
+        self._call('doDriftCorrect')
+
+        # Offset of the current gaze from the target
+        gx, gy, gp = self._gazeat(self._sampleno(self._now()))
+        dx, dy = gx - x, gy - y
+        self.calmsg = ('DRIFTCORRECT R RIGHT at {},{} OFFSET {:.2f} deg. '
+                       '{:.1f},{:.1f} pix.'.format(x, y, np.hypot(dx, dy) /
+                                                   self.ppd, dx, dy))
+        self._write('MSG\t{} {}'.format(self._now(), self.calmsg))
+        return 0
+
+    def getCalibrationMessage(self):
+        self._call('getCalibrationMessage')
+        return self.calmsg
+
+    def applyDriftCorrect(self):
+        self._call('applyDriftCorrect')
+        return 0
+
+    def drawText(self, text, pos=None):
+        self._call('drawText')
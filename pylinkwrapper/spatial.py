@@ -0,0 +1,182 @@
+# Uniform grid index for bulk interest area lookups
+from timeit import default_timer
+import numpy as np
+
+# Rough limit on the cells per trial with the default cell size
+MAXCELLS = 4096
+
+
+class iagrid(object):
+    """
+    Interest area lookup for many trials at once. The area covered by all
+    rectangles is split into square cells and every cell of every trial
+    keeps the ``ias`` rows of the rectangles touching it, lowest row first.
+    A lookup finds the cell of each point and only tests that cell's few
+    candidates, instead of every rectangle of the trial.
+
+    Where rectangles overlap the lowest row, i.e. the one listed first,
+    wins, the same as ``detect.hitIA`` and ``metrics.hitrows``. Edges count
+    as inside.
+
+    :param ias: ``ias`` table from ``ascparse.parse`` or a samplestore, or
+                any structured array with trial, l, t, r and b fields.
+    :type ias: numpy.ndarray
+    :param ntrials: Number of trials.
+    :type ntrials: int
+    :param cell: Cell size in pixels. Defaults to the median of the
+                 rectangles' shorter sides, which keeps the candidates per
+                 cell to a handful, grown if needed so a trial has about
+                 ``MAXCELLS`` cells. A thin rectangle can't blow up the grid.
+    :type cell: float
+    """
+
+    def __init__(self, ias, ntrials, cell=None):
+        self.ntrials = ntrials
+        l, t, r, b = [np.asarray(ias[f], dtype=float)
+                      for f in ('l', 't', 'r', 'b')]
+
+        if not len(ias):
+            self.cell = 1.0
+            self.x0 = self.y0 = 0.0
+            self.nx = self.ny = 1
+            self.cand = np.full((ntrials, 1, 1), -1, dtype=np.int32)
+            self.rects = np.zeros((0, 4))
+            return
+
+        self.x0, self.y0 = l.min(), t.min()
+        if cell is None:
+            cell = max(np.median(np.minimum(r - l, b - t)), 1.0,
+                       np.sqrt((r.max() - self.x0) * (b.max() - self.y0) /
+                               MAXCELLS))
+        self.cell = float(cell)
+        self.nx = int((r.max() - self.x0) // self.cell) + 1
+        self.ny = int((b.max() - self.y0) // self.cell) + 1
+        self.rects = np.column_stack([l, t, r, b])
+
+        # Cell ranges covered by each rectangle, edges included
+        cx0 = ((l - self.x0) // self.cell).astype(int)
+        cx1 = ((r - self.x0) // self.cell).astype(int)
+        cy0 = ((t - self.y0) // self.cell).astype(int)
+        cy1 = ((b - self.y0) // self.cell).astype(int)
+        wide = cx1 - cx0 + 1
+        count = wide * (cy1 - cy0 + 1)
+
+        # One entry per (rectangle, cell) pair
+        row = np.repeat(np.arange(len(ias)), count)
+        k = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count,
+                                               count)
+        cx = cx0[row] + k % wide[row]
+        cy = cy0[row] + k // wide[row]
+        trial = np.asarray(ias['trial'])[row]
+        key = (trial.astype(np.int64) * self.ny + cy) * self.nx + cx
+
+        # Rank within each cell, lowest row first
+        order = np.lexsort((row, key))
+        key, row = key[order], row[order]
+        start = np.searchsorted(key, key)
+        rank = np.arange(len(key)) - start
+
+        self.cand = np.full((ntrials * self.ny * self.nx, rank.max() + 1), -1,
+                            dtype=np.int32)
+        self.cand[key, rank] = row
+        self.cand = self.cand.reshape(ntrials, self.ny, self.nx, -1)
+
+    def lookup(self, trial, x, y):
+        """
+        Finds the interest area of each point.
+
+        :param trial: Trial number per point.
+        :type trial: array_like
+        :param x: X coordinates in EyeLink pixels.
+        :type x: array_like
+        :param y: Y coordinates in EyeLink pixels.
+        :type y: array_like
+        :returns: Row of the ``ias`` table per point, -1 where none.
+        :rtype: numpy.ndarray
+        """
+
+        trial = np.asarray(trial)
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        hit = np.full(len(x), -1, dtype=np.int64)
+
+        # Points outside the grid (or NaN) can't hit anything
+        cx = np.floor((x - self.x0) / self.cell)
+        cy = np.floor((y - self.y0) / self.cell)
+        ok = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny)
+        idx = np.nonzero(ok)[0]
+        cand = self.cand[trial[idx], cy[idx].astype(int), cx[idx].astype(int)]
+
+        # Test the candidates in order, the first one inside wins
+        xs, ys = x[idx], y[idx]
+        found = np.full(len(idx), -1, dtype=np.int64)
+        for k in range(cand.shape[1]):
+            rows = cand[:, k]
+            rect = self.rects[np.maximum(rows, 0)]
+            inside = ((rows >= 0) & (found < 0) &
+                      (xs >= rect[:, 0]) & (xs <= rect[:, 2]) &
+                      (ys >= rect[:, 1]) & (ys <= rect[:, 3]))
+            found[inside] = rows[inside]
+        hit[idx] = found
+
+        return hit
+
+
+def benchmark(nfix=1000000, ntrials=480, sres=(1920, 1080), ppd=35.0,
+              rng=np.random):
+    """
+    Times ``iagrid`` against the brute force ``metrics.hitrows`` on random
+    points over synthetic trial layouts and checks that they agree.
+
+    :param nfix: Number of points.
+    :type nfix: int
+    :param ntrials: Number of trials.
+    :type ntrials: int
+    :param sres: Screen resolution in pixels.
+    :type sres: tuple
+    :param ppd: Pixels per degree visual angle.
+    :type ppd: float
+    :param rng: Random number source.
+    :type rng: numpy.random.RandomState
+    :returns: Dictionary with ``build``, ``grid`` and ``brute`` times in
+              seconds and the number of points per second of each lookup.
+    :rtype: dict
+    """
+
+    import metrics
+    import synth
+
+    # Interest areas laid out like the experiment
+    rows = []
+    for tnum in range(ntrials):
+        for ia in synth.gridIA(sres, ppd, 'random', rng):
+            rows.append((tnum, ia[0], ia[2], ia[3], ia[4], ia[5]))
+    ias = np.array(rows, dtype=[('trial', 'i4'), ('index', 'i4'),
+                                ('l', 'f4'), ('t', 'f4'), ('r', 'f4'),
+                                ('b', 'f4')])
+
+    # Points spread over the screen, like fixations
+    pts = np.zeros(nfix, dtype=[('x', 'f4'), ('y', 'f4')])
+    pts['x'] = rng.uniform(0, sres[0], nfix)
+    pts['y'] = rng.uniform(0, sres[1], nfix)
+    trial = rng.randint(0, ntrials, nfix)
+
+    start = default_timer()
+    grid = iagrid(ias, ntrials)
+    build = default_timer() - start
+
+    start = default_timer()
+    fast = grid.lookup(trial, pts['x'], pts['y'])
+    gtime = default_timer() - start
+
+    start = default_timer()
+    rects, slots = metrics.iaindex(ias, ntrials)
+    slow = metrics.hitrows(pts, trial, rects, slots)
+    btime = default_timer() - start
+
+    if not np.array_equal(fast, slow):
+        raise AssertionError('iagrid and brute force lookups disagree on '
+                             '{} points'.format((fast != slow).sum()))
+
+    return {'build': build, 'grid': gtime, 'brute': btime,
+            'gridrate': nfix / gtime, 'bruterate': nfix / btime}
@@ -0,0 +1,182 @@
+# Parsed sessions cached on disk for memory-mapped access
+import hashlib
+import os
+import shutil
+import subprocess
+import numpy as np
+import ascparse
+
+# Bump when the layout changes so old caches are rebuilt
+VERSION = 2
+
+# Sample columns, one .npy file each
+COLUMNS = ('time', 'x', 'y', 'pupil')
+
+# Tables stored whole
+TABLES = ('events', 'trials', 'ias', 'vars', 'msgs')
+
+
+def filehash(path, block=1 << 20):
+    """
+    Hashes a file's contents.
+
+    :param path: File to hash.
+    :type path: str
+    :param block: Bytes read at a time.
+    :type block: int
+    :returns: Hex SHA-1 digest.
+    :rtype: str
+    """
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as hf:
+        while True:
+            buff = hf.read(block)
+            if not buff:
+                break
+            sha.update(buff)
+
+    return sha.hexdigest()
+
+
+def toASC(edfpath):
+    """
+    Converts an EDF to ASC next to it with SR Research's ``edf2asc``, which
+    must be on the path.
+
+    :param edfpath: EDF file.
+    :type edfpath: str
+    :returns: Path of the ASC file.
+    :rtype: str
+    """
+
+    ascpath = os.path.splitext(edfpath)[0] + '.asc'
+    if subprocess.call(['edf2asc', '-y', edfpath]) != 0 or \
+            not os.path.exists(ascpath):
+        raise IOError('edf2asc failed for {}'.format(edfpath))
+
+    return ascpath
+
+
+def load(path, cachedir=None, eye='R'):
+    """
+    Opens the sample store of an EDF or ASC file, building it first if the
+    cache has no store for the file's contents. EDFs are converted with
+    ``toASC``.
+
+    :param path: EDF or ASC file.
+    :type path: str
+    :param cachedir: Folder holding stores. Defaults to :file:`cache` next to
+                     the file.
+    :type cachedir: str
+    :param eye: Eye to keep from binocular recordings, 'L' or 'R'.
+    :type eye: str
+    :returns: The store.
+    :rtype: samplestore
+    """
+
+    if cachedir is None:
+        cachedir = os.path.join(os.path.dirname(os.path.abspath(path)),
+                                'cache')
+
+    key = '{}_{}_v{}'.format(filehash(path)[:16], eye, VERSION)
+    spath = os.path.join(cachedir, key)
+    if not os.path.exists(os.path.join(spath, 'trials.npy')):
+        ascpath = path
+        if path.lower().endswith('.edf'):
+            ascpath = toASC(path)
+        write(ascparse.parse(ascpath, eye), spath)
+
+    return samplestore(spath)
+
+
+def write(parsed, spath):
+    """
+    Writes ``ascparse.parse`` output as a store. Files go to a temporary
+    folder that is renamed into place, so a store is either complete or
+    missing.
+
+    :param parsed: Output of ``ascparse.parse``.
+    :type parsed: dict
+    :param spath: Folder of the store.
+    :type spath: str
+    """
+
+    tmp = spath + '.tmp{}'.format(os.getpid())
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    samples = parsed['samples']
+    for name in COLUMNS:
+        np.save(os.path.join(tmp, name + '.npy'),
+                np.ascontiguousarray(samples[name]))
+    for name in TABLES:
+        np.save(os.path.join(tmp, name + '.npy'), parsed[name])
+
+    # Another process may have built it in the meantime
+    if os.path.isdir(spath):
+        shutil.rmtree(tmp)
+    else:
+        os.rename(tmp, spath)
+
+
+class samplestore(object):
+    """
+    Random access to a parsed session. Sample columns are memory-mapped, so
+    opening a store reads nothing but the small tables and a trial's samples
+    are read from disk only when used.
+
+    :param spath: Folder written by ``write``.
+    :type spath: str
+    """
+
+    def __init__(self, spath):
+        self.path = spath
+        self.columns = dict((name, np.load(os.path.join(spath, name + '.npy'),
+                                           mmap_mode='r'))
+                            for name in COLUMNS)
+        for name in TABLES:
+            setattr(self, name, np.load(os.path.join(spath, name + '.npy')))
+        self.ntrials = len(self.trials)
+
+    def __len__(self):
+        return self.ntrials
+
+    def samples(self, tnum):
+        """
+        Gets a trial's samples.
+
+        :param tnum: Trial number, counting TRIALID messages from 0.
+        :type tnum: int
+        :returns: Dictionary of column name to memory-mapped view.
+        :rtype: dict
+        """
+
+        first, last = self.trials['sfirst'][tnum], self.trials['slast'][tnum]
+
+        return dict((name, col[first:last])
+                    for name, col in self.columns.items())
+
+    def trialEvents(self, tnum):
+        """
+        Gets a trial's fixations, saccades and blinks.
+
+        :param tnum: Trial number.
+        :type tnum: int
+        :rtype: numpy.ndarray
+        """
+
+        return self.events[self.trials['efirst'][tnum]:
+                           self.trials['elast'][tnum]]
+
+    def trialIAs(self, tnum):
+        """
+        Gets a trial's interest areas.
+
+        :param tnum: Trial number.
+        :type tnum: int
+        :rtype: numpy.ndarray
+        """
+
+        return self.ias[self.ias['trial'] == tnum]
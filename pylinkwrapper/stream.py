@@ -0,0 +1,230 @@
+# Background buffering of link samples and events
+import threading
+import time
+import numpy as np
+import linkconst
+
+# Layout of one buffered row. etype holds the pylink data type code.
+SDTYPE = np.dtype([('time', 'f8'),
+                   ('lx', 'f4'), ('ly', 'f4'),
+                   ('rx', 'f4'), ('ry', 'f4'),
+                   ('lpup', 'f4'), ('rpup', 'f4'),
+                   ('etype', 'i2')])
+
+# Event types that get a row in the buffer
+EVENTS = (linkconst.STARTFIX, linkconst.ENDFIX, linkconst.STARTSACC,
+          linkconst.ENDSACC, linkconst.STARTBLINK, linkconst.ENDBLINK)
+
+
+class lockedtracker(object):
+    """
+    Wraps a pylink EyeLink object so every method call holds ``lock``.
+    pylink is not safe to call from two threads at once, so everything that
+    shares a tracker with a ``gazestream`` has to call it through the same
+    ``lockedtracker``. ``connect`` wraps its tracker in one.
+
+    :param tracker: pylink EyeLink object (or stand-in) to wrap.
+    :param lock: Lock to hold. Defaults to a new ``threading.RLock``, which
+                 lets pylink call back into the tracker, e.g. from the
+                 calibration display.
+    """
+
+    def __init__(self, tracker, lock=None):
+        self.tracker = tracker
+        self.lock = threading.RLock() if lock is None else lock
+
+    def __getattr__(self, name):
+        attr = getattr(self.tracker, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+
+        # Later calls skip the lookup
+        setattr(self, name, call)
+
+        return call
+
+
+class gazestream(object):
+    """
+    Drains samples and events from the link on a background thread into a
+    preallocated ring buffer. The buffer is stored twice end to end so the
+    most recent rows can always be handed out as a single contiguous view.
+
+    Views share memory with the buffer and are overwritten once ``size`` newer
+    rows have arrived, so copy anything that needs to be kept.
+
+    The thread holds the tracker's lock for each row it reads, see
+    ``lockedtracker``. A tracker that isn't a ``lockedtracker`` is wrapped in
+    a new one, and other code must then use ``self.tracker`` rather than the
+    tracker that was passed in.
+
+    :param tracker: pylink EyeLink object that is recording with link data on.
+    :param size: Number of rows kept in the buffer.
+    :type size: int
+    :param poll: Seconds to sleep when the link has no new data.
+    :type poll: float
+    """
+
+    def __init__(self, tracker, size=60000, poll=.001):
+        if not isinstance(tracker, lockedtracker):
+            tracker = lockedtracker(tracker)
+        self.tracker = tracker
+        self.size = size
+        self.poll = poll
+
+        # Preallocate mirrored buffer
+        self.buff = np.zeros(size * 2, dtype=SDTYPE)
+        self.count = 0
+
+        # Thread controls
+        self._halt = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts draining the link on a background thread.
+        """
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._halt.clear()
+        self._thread = threading.Thread(target=self._drain,
+                                        name='gazestream')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread and waits for it to finish.
+        """
+
+        self._halt.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def clear(self):
+        """
+        Forgets all buffered rows, e.g. at the start of a trial.
+        """
+
+        self.count = 0
+
+    def window(self, n=None):
+        """
+        Returns a view of the most recent rows.
+
+        :param n: Number of rows. Defaults to everything still buffered.
+        :type n: int
+        :returns: Structured array view with fields from ``SDTYPE``.
+        """
+
+        count = self.count
+        if n is None or n > self.size:
+            n = self.size
+        n = min(n, count)
+        start = (count - n) % self.size
+
+        return self.buff[start:start + n]
+
+    def since(self, mark):
+        """
+        Returns a view of rows that arrived after ``mark`` and the new mark.
+        Rows older than the buffer size are skipped.
+
+        :param mark: Row count returned by a previous call, 0 to start.
+        :type mark: int
+        :returns: (view, mark)
+        """
+
+        count = self.count
+        n = min(count - mark, self.size)
+        if n <= 0:
+            return self.buff[:0], count
+        start = (count - n) % self.size
+
+        return self.buff[start:start + n], count
+
+    def samples(self, timeout=None):
+        """
+        Generator that yields views of new rows as they arrive.
+
+        :param timeout: Stop after this many seconds without new data. None
+                        keeps going until the stream is stopped.
+        :type timeout: float or None
+        """
+
+        mark = self.count
+        idle = time.time()
+        while not self._halt.is_set():
+            rows, mark = self.since(mark)
+            if len(rows):
+                idle = time.time()
+                yield rows
+            elif timeout is not None and time.time() - idle > timeout:
+                break
+            else:
+                time.sleep(self.poll)
+
+    def _push(self, row):
+        # Write both halves before publishing the new count
+        i = self.count % self.size
+        self.buff[i] = row
+        self.buff[i + self.size] = row
+        self.count += 1
+
+    def _drain(self):
+        nan = float('nan')
+        lock = self.tracker.lock
+        link = self.tracker.tracker
+        while not self._halt.is_set():
+            # Read the type and its data without the main thread in between
+            with lock:
+                dtype = link.getNextData()
+                data = link.getFloatData() if dtype else None
+            if not dtype:
+                time.sleep(self.poll)
+                continue
+
+            if dtype == linkconst.SAMPLE_TYPE:
+                lx = ly = rx = ry = lp = rp = nan
+                if data.isLeftSample():
+                    lx, ly = _gaze(data.getLeftEye().getGaze())
+                    lp = data.getLeftEye().getPupilSize()
+                if data.isRightSample():
+                    rx, ry = _gaze(data.getRightEye().getGaze())
+                    rp = data.getRightEye().getPupilSize()
+                row = (data.getTime(), lx, ly, rx, ry, lp, rp, dtype)
+
+            elif dtype in EVENTS:
+                # Start events carry start gaze, end events the average
+                if dtype in (linkconst.STARTFIX, linkconst.STARTSACC):
+                    ts, gz = data.getStartTime(), data.getStartGaze()
+                elif dtype == linkconst.ENDFIX:
+                    ts, gz = data.getEndTime(), data.getAverageGaze()
+                elif dtype == linkconst.ENDSACC:
+                    ts, gz = data.getEndTime(), data.getEndGaze()
+                elif dtype == linkconst.STARTBLINK:
+                    ts, gz = data.getStartTime(), (nan, nan)
+                else:
+                    ts, gz = data.getEndTime(), (nan, nan)
+
+                gx, gy = _gaze(gz)
+                if data.getEye() == 1:
+                    row = (ts, nan, nan, gx, gy, nan, nan, dtype)
+                else:
+                    row = (ts, gx, gy, nan, nan, nan, nan, dtype)
+            else:
+                continue
+
+            self._push(row)
+
+
+def _gaze(gz):
+    # Convert pylink missing values to nan
+    return [float('nan') if v == linkconst.MISSING_DATA else v for v in gz[:2]]
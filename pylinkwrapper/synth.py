@@ -0,0 +1,310 @@
+# Synthetic gaze data for exercising the pipeline without the lab
+import numpy as np
+
+# Layout of generated samples
+GDTYPE = np.dtype([('time', 'f8'), ('x', 'f4'), ('y', 'f4'),
+                   ('pupil', 'f4')])
+
+# Layout of generated fixations, saccades and blinks. etype is 'F', 'S' or
+# 'B'; x/y are the average (fixation) or start (saccade) position and ex/ey
+# the end position of saccades.
+EDTYPE = np.dtype([('etype', 'S1'), ('start', 'f8'), ('end', 'f8'),
+                   ('x', 'f4'), ('y', 'f4'), ('ex', 'f4'), ('ey', 'f4')])
+
+
+def gridIA(sres, ppd, ttype='random', rng=np.random):
+    """
+    Makes interest areas like ``Trial.setup_images``: a 2 degree fixation
+    area plus ten 3 degree squares on a jittered 4 x 3 grid with the middle
+    two slots removed. Slot 1 holds the target on target and similar trials
+    and slot 2 the similar image on similar trials.
+
+    :param sres: Screen resolution in pixels.
+    :type sres: tuple
+    :param ppd: Pixels per degree visual angle.
+    :type ppd: float
+    :param ttype: Trial type, 'target', 'similar' or 'random'.
+    :type ttype: str
+    :param rng: Random number source.
+    :type rng: numpy.random.RandomState
+    :returns: Interest areas as [index, name, left, top, right, bottom] in
+              EyeLink pixels, as kept in ``connect.ias``.
+    :rtype: list
+    """
+
+    # Same grid and jitter as the experiment
+    coords = [(x, y) for y in [-4, 0, 4] for x in np.linspace(-10, 10, 4)]
+    del coords[5:7]
+    coords = np.array(coords) + rng.uniform(-0.5, 0.5, (len(coords), 2))
+
+    names = ['nonTarget.syn_{}'.format(i + 1) for i in range(len(coords))]
+    if ttype in ('target', 'similar'):
+        names[0] = 'target.syn_1'
+    if ttype == 'similar':
+        names[1] = 'similar.syn_2'
+
+    ias = [_square(1, 'fixation', 0, 0, 2, sres, ppd)]
+    for i, (x, y) in enumerate(coords):
+        ias.append(_square(i + 2, names[i], x, y, 3, sres, ppd))
+
+    return ias
+
+
+def _square(index, name, x, y, size, sres, ppd):
+    # Degrees from centre to EyeLink pixel rectangle, like connect.drawIA
+    elx = x * ppd + sres[0] / 2.0
+    ely = -y * ppd + sres[1] / 2.0
+    half = size * ppd / 2.0
+    return [index, name, round(elx - half), round(ely - half),
+            round(elx + half), round(ely + half)]
+
+
+def scanpath(dur, targets, srate=1000, ppd=35.0, t0=0.0, fixdur=250.0,
+             drift=1.0, noise=.01, blinkrate=.3, pupil=1000.0,
+             rng=np.random):
+    """
+    Generates gaze that fixates the given positions in random order, with
+    main sequence saccades between them, drift within fixations, blinks and
+    a slowly changing pupil.
+
+    :param dur: Length in ms.
+    :type dur: float
+    :param targets: Candidate fixation positions in EyeLink pixels, shape
+                    (n, 2). The first fixation is on the first position.
+    :type targets: array_like
+    :param srate: Sampling rate in Hz.
+    :type srate: int
+    :param ppd: Pixels per degree visual angle.
+    :type ppd: float
+    :param t0: Time of the first sample in ms.
+    :type t0: float
+    :param fixdur: Mean fixation duration in ms.
+    :type fixdur: float
+    :param drift: Drift speed within fixations in degrees per second. The
+                  random walk step is scaled to the sample rate.
+    :type drift: float
+    :param noise: Measurement noise in degrees.
+    :type noise: float
+    :param blinkrate: Blinks per second.
+    :type blinkrate: float
+    :param pupil: Mean pupil size.
+    :type pupil: float
+    :param rng: Random number source.
+    :type rng: numpy.random.RandomState
+    :returns: (samples, events) as arrays of ``GDTYPE`` and ``EDTYPE``.
+    """
+
+    n = int(dur * srate / 1000.0)
+    msps = 1000.0 / srate
+    targets = np.asarray(targets, dtype=float).reshape(-1, 2)
+
+    # Enough fixations to fill the time even if they all come out short
+    nfix = int(dur / (fixdur * .25)) + 2
+    pick = rng.randint(0, len(targets), nfix)
+    pick[0] = 0
+    fpos = targets[pick] + rng.normal(0, .3 * ppd, (nfix, 2))
+
+    # Fixation lengths from a gamma, saccade lengths from the main sequence
+    flen = np.maximum(rng.gamma(4.0, fixdur / 4.0, nfix) / msps, 1).astype(int)
+    amp = np.hypot(*(np.diff(fpos, axis=0).T)) / ppd
+    slen = np.maximum((2.2 * amp + 21) / msps, 1).astype(int)
+    slen = np.r_[slen, 1]
+
+    # Interleave fixation and saccade segments and cut to length
+    seglen = np.column_stack([flen, slen]).ravel()
+    segstart = np.r_[0, np.cumsum(seglen)[:-1]]
+    seg = np.repeat(np.arange(len(seglen)), seglen)[:n]
+    off = np.arange(len(seg)) - segstart[seg]
+    fix = seg // 2
+    infix = seg % 2 == 0
+
+    # Drift as a random walk restarting each fixation
+    step = drift * ppd / float(srate)
+    walk = np.cumsum(rng.normal(0, step, (len(seg), 2)), axis=0)
+    walk -= walk[segstart[seg]]
+
+    # Saccades follow a smooth position profile between fixations
+    prog = .5 - .5 * np.cos(np.pi * (off + 1) / seglen[seg])
+    nxt = np.minimum(fix + 1, nfix - 1)
+    sacc = fpos[fix] + (fpos[nxt] - fpos[fix]) * prog[:, None]
+    gaze = np.where(infix[:, None], fpos[fix] + walk, sacc)
+    gaze += rng.normal(0, noise * ppd, gaze.shape)
+
+    # Pupil wanders slowly around its mean
+    slow = np.cumsum(rng.normal(0, 1, len(seg)))
+    if len(seg):
+        slow -= np.linspace(0, slow[-1], len(seg))
+    psize = pupil + slow * pupil * .002
+
+    # Blinks blank out gaze and pupil
+    nblink = rng.poisson(blinkrate * dur / 1000.0)
+    bstart = np.sort(rng.randint(0, max(n, 1), nblink))
+    blen = (rng.uniform(80, 250, nblink) / msps).astype(int)
+    edge = np.zeros(n + 1, dtype=int)
+    np.add.at(edge, bstart, 1)
+    np.add.at(edge, np.minimum(bstart + blen, n), -1)
+    blink = np.cumsum(edge)[:n] > 0
+    gaze[blink] = np.nan
+    psize[blink] = 0
+
+    samples = np.zeros(n, dtype=GDTYPE)
+    samples['time'] = t0 + np.arange(n) * msps
+    samples['x'] = gaze[:, 0]
+    samples['y'] = gaze[:, 1]
+    samples['pupil'] = psize
+
+    # Event table from segments that started inside the recording
+    segend = np.minimum(segstart + seglen, n) - 1
+    keep = segstart < n
+    fs = segstart[keep]
+    fe = segend[keep]
+    isfix = (np.arange(len(seglen)) % 2 == 0)[keep]
+    fidx = (np.arange(len(seglen)) // 2)[keep]
+    fnext = np.minimum(fidx + 1, nfix - 1)
+
+    events = np.zeros(len(fs) + nblink, dtype=EDTYPE)
+    events['etype'][:len(fs)] = np.where(isfix, b'F', b'S')
+    events['start'][:len(fs)] = t0 + fs * msps
+    events['end'][:len(fs)] = t0 + fe * msps
+    events['x'][:len(fs)] = fpos[fidx, 0]
+    events['y'][:len(fs)] = fpos[fidx, 1]
+    events['ex'][:len(fs)] = np.where(isfix, fpos[fidx, 0], fpos[fnext, 0])
+    events['ey'][:len(fs)] = np.where(isfix, fpos[fidx, 1], fpos[fnext, 1])
+    events['etype'][len(fs):] = b'B'
+    events['start'][len(fs):] = t0 + bstart * msps
+    events['end'][len(fs):] = t0 + (np.minimum(bstart + blen, n) - 1) * msps
+    events = events[np.argsort(events['start'], kind='mergesort')]
+
+    return samples, events
+
+
+def session(ntrials, sres=(1920, 1080), ppd=35.0, srate=1000,
+            rng=np.random):
+    """
+    Generates a whole session laid out like the experiment: every trial has a
+    1 second pupil time recording on the fixation point followed by a search
+    display recording until a response.
+
+    :param ntrials: Number of trials.
+    :type ntrials: int
+    :param sres: Screen resolution in pixels.
+    :type sres: tuple
+    :param ppd: Pixels per degree visual angle.
+    :type ppd: float
+    :param srate: Sampling rate in Hz.
+    :type srate: int
+    :param rng: Random number source.
+    :type rng: numpy.random.RandomState
+    :returns: List of trial dictionaries with ``ias``, ``samples``,
+              ``events``, ``vars``, ``start``, ``end`` and ``onset``. Pupil
+              time recordings have ``pupiltime`` set.
+    :rtype: list
+    """
+
+    trials = []
+    centre = [[sres[0] / 2.0, sres[1] / 2.0]]
+    ttypes = ['target', 'similar', 'random']
+    now = 1000.0
+    for tnum in range(1, ntrials + 1):
+        # Pupil time epoch on the fixation dot
+        pfix = [_square(1, 'pfixation', 0, 0, 2, sres, ppd)]
+        samp, evs = scanpath(1000, centre, srate, ppd, now + 20,
+                             fixdur=2000.0, rng=rng)
+        trials.append({'ias': pfix, 'samples': samp, 'events': evs,
+                       'vars': {}, 'start': now, 'onset': now + 20,
+                       'end': now + 1020, 'pupiltime': True})
+        now += 1500
+
+        # Search display, looking at the centre first
+        ttype = ttypes[rng.randint(0, 3)]
+        ias = gridIA(sres, ppd, ttype, rng)
+        cen = np.array([[(ia[2] + ia[4]) / 2.0, (ia[3] + ia[5]) / 2.0]
+                        for ia in ias])
+        rt = rng.uniform(1000, 4000)
+        samp, evs = scanpath(rt, cen, srate, ppd, now + 20, rng=rng)
+        tvars = {'tnum': tnum, 'tar': ttype != 'random',
+                 'sim': ttype == 'similar', 'rt': round(rt / 1000.0, 4)}
+        trials.append({'ias': ias, 'samples': samp, 'events': evs,
+                       'vars': tvars, 'start': now, 'onset': now + 20,
+                       'end': now + 20 + rt, 'pupiltime': False})
+        now += rt + 2500
+
+    return trials
+
+
+def toTracker(tracker, samples):
+    """
+    Loads generated samples into a ``simtracker.simtracker`` for replay.
+
+    :param tracker: Simulated tracker.
+    :param samples: Array of ``GDTYPE``.
+    """
+
+    tracker.setGaze(samples['x'], samples['y'], samples['pupil'])
+
+
+def writeASC(path, trials, eye='R', chunk=200000):
+    """
+    Writes trials from ``session`` to a file in the EyeLink ASC format with the
+    same messages the connector sends.
+
+    :param path: File to write.
+    :type path: str
+    :param trials: Trials from ``session``.
+    :type trials: list
+    :param eye: Eye label, 'L' or 'R'.
+    :type eye: str
+    :param chunk: Samples formatted per write.
+    :type chunk: int
+    """
+
+    ename = {'L': 'LEFT', 'R': 'RIGHT'}[eye]
+    with open(path, 'w') as asc:
+        asc.write('** CONVERTED FROM SYNTH\n')
+        for trial in trials:
+            start = int(trial['start'])
+            asc.write('MSG\t{} TRIALID 1\n'.format(start))
+            for ia in trial['ias']:
+                asc.write('MSG\t{} !V IAREA RECTANGLE {} {:.0f} {:.0f} '
+                          '{:.0f} {:.0f} {}\n'.format(start, *ia[:1] +
+                                                      ia[2:] + ia[1:2]))
+            if trial['pupiltime']:
+                asc.write('MSG\t{} pupiltime\n'.format(start))
+            asc.write('START\t{} {}\tSAMPLES\tEVENTS\n'.format(
+                int(trial['onset']), ename))
+
+            # Samples, formatted a chunk at a time
+            samp = trial['samples']
+            for c in range(0, len(samp), chunk):
+                part = samp[c:c + chunk]
+                cols = np.column_stack([part['time'], part['x'], part['y'],
+                                        part['pupil']]).ravel()
+                # 2000 Hz recordings have half millisecond times
+                tfmt = '%d' if not np.any(part['time'] % 1) else '%.1f'
+                fmt = tfmt + '\t%.1f\t%.1f\t%.1f\t...\n'
+                txt = (fmt * len(part)) % tuple(cols)
+                asc.write(txt.replace('nan', '  .'))
+
+            # Events
+            for ev in trial['events']:
+                et = ev['etype'].decode() if isinstance(
+                    ev['etype'], bytes) else ev['etype']
+                s, e = int(ev['start']), int(ev['end'])
+                if et == 'F':
+                    asc.write('EFIX {}   {}\t{}\t{}\t{:.1f}\t{:.1f}\t0\n'.format(
+                        eye, s, e, e - s + 1, ev['x'], ev['y']))
+                elif et == 'S':
+                    asc.write('ESACC {}  {}\t{}\t{}\t{:.1f}\t{:.1f}\t{:.1f}\t'
+                              '{:.1f}\t0.00\t0\n'.format(
+                                  eye, s, e, e - s + 1, ev['x'], ev['y'],
+                                  ev['ex'], ev['ey']))
+                else:
+                    asc.write('EBLINK {} {}\t{}\t{}\n'.format(eye, s, e,
+                                                              e - s + 1))
+
+            end = int(trial['end'])
+            asc.write('END\t{} \tSAMPLES\tEVENTS\n'.format(end))
+            for name in sorted(trial['vars']):
+                asc.write('MSG\t{} !V TRIAL_VAR {} {}\n'.format(
+                    end, name, trial['vars'][name]))
+            asc.write('MSG\t{} TRIAL_RESULT 0\n'.format(end))
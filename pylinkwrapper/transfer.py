@@ -0,0 +1,203 @@
+# Background EDF transfer with retries and a queue for failed files
+import json
+import os
+import threading
+import time
+
+
+class edftransfer(object):
+    """
+    Receives an EDF file from the EyeLink host on a background thread. The
+    received size is checked against what the host reports and failed
+    transfers are retried, then added to a queue file so they can be pulled
+    later with ``python -m pylinkwrapper pull``.
+
+    :param tracker: pylink EyeLink object with the data file closed.
+    :param src: Name of the EDF file on the host.
+    :type src: str
+    :param dest: Local path to save the EDF file to.
+    :type dest: str
+    :param retries: Number of attempts before giving up.
+    :type retries: int
+    :param qpath: Queue file for failed transfers. None disables queueing.
+    :type qpath: str
+    """
+
+    def __init__(self, tracker, src, dest, retries=3, qpath=None):
+        self.tracker = tracker
+        self.src = src
+        self.dest = dest
+        self.retries = retries
+        self.qpath = qpath
+
+        # Results
+        self.size = None
+        self.attempts = 0
+        self.ok = False
+        self.error = None
+
+        self._thread = threading.Thread(target=self._run, name='edftransfer')
+        self._thread.daemon = True
+
+    def start(self):
+        """
+        Starts the transfer.
+        """
+
+        self._thread.start()
+
+        return self
+
+    def alive(self):
+        """
+        Is the transfer still running?
+
+        :rtype: bool
+        """
+
+        return self._thread.is_alive()
+
+    def received(self):
+        """
+        Bytes written to the local file so far.
+
+        :rtype: int
+        """
+
+        try:
+            return os.path.getsize(self.dest)
+        except OSError:
+            return 0
+
+    def wait(self, progress=None, interval=.1):
+        """
+        Waits for the transfer to finish, reporting progress along the way.
+        The callback runs on the calling thread so it may draw and flip.
+
+        :param progress: Called as ``progress(received)`` every interval.
+        :type progress: callable
+        :param interval: Seconds between progress calls.
+        :type interval: float
+        :returns: Whether the file was received intact.
+        :rtype: bool
+        """
+
+        while self.alive():
+            if progress is not None:
+                progress(self.received())
+            self._thread.join(interval)
+        if progress is not None:
+            progress(self.received())
+
+        return self.ok
+
+    def _run(self):
+        while self.attempts < self.retries and not self.ok:
+            self.attempts += 1
+            try:
+                size = self.tracker.receiveDataFile(self.src, self.dest)
+                self.error = None
+            except Exception as err:
+                size = -1
+                self.error = str(err)
+
+            # Host reports size sent, compare with what's on disk
+            if size > 0 and self.received() == size:
+                self.size = size
+                self.ok = True
+            else:
+                if self.error is None:
+                    self.error = 'received {} of {} bytes'.format(
+                        self.received(), size)
+                if self.attempts < self.retries:
+                    time.sleep(1)
+
+        if not self.ok and self.qpath is not None:
+            queueFile(self.qpath, self.src, self.dest)
+
+
+def loadQueue(qpath):
+    """
+    Reads the list of transfers still to do.
+
+    :param qpath: Path of queue file.
+    :type qpath: str
+    :returns: List of dictionaries with ``src`` and ``dest``.
+    :rtype: list
+    """
+
+    if not os.path.exists(qpath):
+        return []
+    with open(qpath) as qf:
+        return json.load(qf)
+
+
+def saveQueue(qpath, queue):
+    """
+    Writes the list of transfers still to do, removing the file when empty.
+
+    :param qpath: Path of queue file.
+    :type qpath: str
+    :param queue: List of dictionaries with ``src`` and ``dest``.
+    :type queue: list
+    """
+
+    if not queue:
+        if os.path.exists(qpath):
+            os.remove(qpath)
+        return
+
+    # Write then rename so a crash never leaves half a queue
+    tmp = qpath + '.tmp'
+    with open(tmp, 'w') as qf:
+        json.dump(queue, qf, indent=1)
+    if os.path.exists(qpath):
+        os.remove(qpath)
+    os.rename(tmp, qpath)
+
+
+def queueFile(qpath, src, dest):
+    """
+    Adds a failed transfer to the queue.
+
+    :param qpath: Path of queue file.
+    :type qpath: str
+    :param src: Name of the EDF file on the host.
+    :type src: str
+    :param dest: Local path to save the EDF file to.
+    :type dest: str
+    """
+
+    queue = loadQueue(qpath)
+    entry = {'src': src, 'dest': dest}
+    if entry not in queue:
+        queue.append(entry)
+    saveQueue(qpath, queue)
+
+
+def pullQueued(tracker, qpath, retries=3, report=None):
+    """
+    Retries every queued transfer. Successful ones are removed from the queue.
+
+    :param tracker: Connected pylink EyeLink object.
+    :param qpath: Path of queue file.
+    :type qpath: str
+    :param retries: Attempts per file.
+    :type retries: int
+    :param report: Called as ``report(transfer)`` after each file.
+    :type report: callable
+    :returns: Number of files still queued.
+    :rtype: int
+    """
+
+    remaining = []
+    for entry in loadQueue(qpath):
+        xfer = edftransfer(tracker, entry['src'], entry['dest'], retries)
+        xfer.start().wait()
+        if report is not None:
+            report(xfer)
+        if not xfer.ok:
+            remaining.append(entry)
+    saveQueue(qpath, remaining)
+
+    return len(remaining)
@@ -260,23 +260,24 @@ class Experiment:
         tut = TUTProbe(window)
 
         # Write the header to the output file
-        header = [
-            'sub',      # Subject id
-            'tcateg',   # Target category
-            'tnum',     # Trial number
-            'tar',      # If target was present
-            'sim',      # If similar was present
-            'resp',     # The response key
-            'rtype',    # The response type (one in ['hi', 'mi', 'fa', 'cr'])
-            'rt',       # Response time
-            'time',     # Trial start time
-            'tutra',    # TUT rating
-            'tuttime',  # TUT test time
-            'hunger',   # The first question's response
-            'tired',    # The second question's response
-            'recorder_trial', # Trial number from recorder file
-        ]
-        output_file.writerow(header)
+        record = pylinkwrapper.trialrecord([
+            ('sub', str),       # Subject id
+            ('tcateg', str),    # Target category
+            ('tnum', int),      # Trial number
+            ('tar', bool),      # If target was present
+            ('sim', bool),      # If similar was present
+            ('resp', str),      # The response key
+            ('rtype', str),     # The response type (one in ['hi', 'mi', 'fa', 'cr'])
+            ('rt', float),      # Response time
+            ('time', float),    # Trial start time
+            ('tutra', int),     # TUT rating
+            ('tuttime', float), # TUT test time
+            ('hunger', int),    # The first question's response
+            ('tired', int),     # The second question's response
+            ('recorder_trial', int), # Trial number from recorder file
+        ])
+        output_file.writerow(record.header)
+        output_file.addColumns(record)  # Typed copy for analysis
 
         total_trials = len(self.trials)
         current_trial_num = 0
@@ -302,6 +303,7 @@ class Experiment:
             trial_time = round(exptime.getTime(), 2)
 
             # Draw images and await a response
+            window.callOnFlip(tracker.send_message, 'stimonset')
             key, response_time = trial.draw_loop(window, dots)
             
             '''# Print screen
@@ -316,6 +318,7 @@ class Experiment:
 
             # Quit?
             if key == 'escape':
+                output_file.close()
                 tracker.end_experiment(experiment_path)
                 core.quit()
 
@@ -354,18 +357,21 @@ class Experiment:
             )
 
             # Eye-tracker post-stim
-            for key, value in trial_results.iteritems():
-                tracker.send_var(key, value)
+            trial_cells = record.serialize(trial_results)
+            for varmsg in record.messages(trial_cells):
+                tracker.send_message(varmsg)
             tracker.set_trialresult()
 
             # Write trial info
-            output_file.writerow([trial_results[col] for col in header])
+            output_file.writerow(trial_cells)
+            output_file.endTrial()
 
             # ISI
             fix.draw()
             window.flip()
             core.wait(2)
 
+        output_file.close()
         tracker.end_experiment(experiment_path)
         core.quit()
 
@@ -499,7 +505,8 @@ def main():
         trials=trials,
         examples=examples,
     )
-    output_file = csv.writer(open(os.path.join(os.getcwd(), 'data_exp2', subject.id + '_mindwand_exp2.csv'), 'wb'))
+    output_file = pylinkwrapper.resultswriter(
+        os.path.join(os.getcwd(), 'data_exp2', subject.id + '_mindwand_exp2.csv'))
     experiment_path = 'C:\\Dropbox\\Exps_Jessica\\mindwand\\edfs_exp2\\'
 
     exp.run(window, tracker, output_file, experiment_path)
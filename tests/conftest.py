@@ -0,0 +1,6 @@
+# The package modules import each other by bare name, so the tests do too
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'pylinkwrapper'))
@@ -0,0 +1,155 @@
+import numpy as np
+import ascparse
+import metrics
+
+# Interest areas the stimulus trial draws, in pixels
+IAS = ['MSG\t1005 !V IAREA RECTANGLE 1 462 334 562 434 fixation',
+       'MSG\t1005 !V IAREA RECTANGLE 2 762 334 912 484 target.a']
+
+
+def _samples(start, end, x, y, binoc=False):
+    # One sample per ms, the other eye 100 px to the left when binocular
+    if binoc:
+        return ['{}\t{:.1f}\t{:.1f}\t1000.0\t{:.1f}\t{:.1f}\t1000.0\t.....'
+                .format(t, x - 100, y, x, y) for t in range(start, end)]
+
+    return ['{}\t{:.1f}\t{:.1f}\t1000.0\t...'.format(t, x, y)
+            for t in range(start, end)]
+
+
+def _fixcheck(start, binoc=False):
+    # fixCheck records between trials without a TRIALID of its own
+    eyes = 'LEFT\tRIGHT' if binoc else 'RIGHT'
+    lines = ['START\t{} {}\tSAMPLES\tEVENTS'.format(start, eyes)]
+    lines += _samples(start, start + 200, 512, 384, binoc)
+    lines += ['EFIX R   {}\t{}\t201\t512.0\t384.0\t1000'.format(
+        start, start + 200)]
+    if binoc:
+        lines += ['EFIX L   {}\t{}\t201\t412.0\t384.0\t1000'.format(
+            start, start + 200)]
+    lines += ['END\t{} \tSAMPLES\tEVENTS'.format(start + 200)]
+
+    return lines
+
+
+def _session(binoc=False):
+    # Laid out like mindwand_exp2_new: fix check, pupil time epoch, then the
+    # stimulus trial, which is still recording at TRIAL_RESULT
+    eyes = 'LEFT\tRIGHT' if binoc else 'RIGHT'
+    lines = ['** CONVERTED FROM TEST', 'MSG\t400 DISPLAY_COORDS 0 0 1024 768']
+    lines += _fixcheck(500, binoc)
+
+    lines += ['MSG\t800 TRIALID 1',
+              'MSG\t800 !V IAREA RECTANGLE 1 462 334 562 434 pfixation',
+              'MSG\t800 pupiltime',
+              'START\t810 {}\tSAMPLES\tEVENTS'.format(eyes)]
+    lines += _samples(810, 1000, 512, 384, binoc)
+    lines += ['END\t1000 \tSAMPLES\tEVENTS', 'MSG\t1001 TRIAL_RESULT 0']
+
+    lines += ['MSG\t1005 TRIALID 1'] + IAS
+    lines += ['START\t1010 {}\tSAMPLES\tEVENTS'.format(eyes)]
+    lines += _samples(1010, 1050, 512, 384, binoc)
+    lines += ['MSG\t1032 2 stimonset']
+    lines += _samples(1050, 1340, 812, 384, binoc)
+    lines += ['EFIX R   1050\t1340\t291\t812.0\t384.0\t1000']
+    if binoc:
+        lines += ['EFIX L   1050\t1340\t291\t712.0\t384.0\t1000']
+    lines += ['MSG\t1341 !V TRIAL_VAR rt 0.33',
+              'MSG\t1341 TRIAL_RESULT 0']
+    lines += _samples(1340, 1400, 512, 384, binoc)
+    lines += ['END\t1400 \tSAMPLES\tEVENTS']
+
+    lines += _fixcheck(2000, binoc)
+    lines += ['MSG\t2300 TRIALID 1', 'MSG\t2300 pupiltime',
+              'START\t2310 {}\tSAMPLES\tEVENTS'.format(eyes)]
+    lines += _samples(2310, 2400, 512, 384, binoc)
+    lines += ['END\t2400 \tSAMPLES\tEVENTS', 'MSG\t2401 TRIAL_RESULT 0']
+
+    return '\n'.join(lines) + '\n'
+
+
+def _parse(tmpdir, binoc=False, **kwargs):
+    path = tmpdir.join('session.asc')
+    path.write(_session(binoc))
+
+    return ascparse.parse(str(path), **kwargs)
+
+
+def test_trials_use_their_first_recording(tmpdir):
+    sess = _parse(tmpdir)
+    trials = sess['trials']
+
+    assert list(trials['start']) == [810, 1010, 2310]
+    assert list(trials['end']) == [1000, 1400, 2400]
+    assert list(trials['pupiltime']) == [True, False, True]
+    for trial in trials:
+        times = sess['samples']['time'][trial['sfirst']:trial['slast']]
+        assert times[0] == trial['start']
+        assert times[-1] == trial['end'] - 1
+        assert len(times) == trial['end'] - trial['start']
+
+    # Only the stimulus fixation, not the fix checks around it
+    assert list(trials['elast'] - trials['efirst']) == [0, 1, 0]
+    fix = sess['events'][trials['efirst'][1]]
+    assert (fix['start'], fix['end'], fix['x']) == (1050, 1340, 812)
+
+
+def test_metrics_skip_fixcheck(tmpdir):
+    sess = _parse(tmpdir, chunk=4096)
+    met, tmet = metrics.iametrics(sess)
+
+    stim = met[met['trial'] == 1]
+    assert list(stim['dwell']) == [0, 290]
+    assert list(stim['nfix']) == [0, 1]
+    assert stim['first'][1] == 20
+    assert tmet['onset'][1] == 1030
+    assert met['nfix'].sum() == 1
+
+
+def test_binocular_keeps_one_eye(tmpdir):
+    for eye, x in (('R', 812), ('L', 712)):
+        sess = _parse(tmpdir, binoc=True, eye=eye)
+        trial = sess['trials'][1]
+        events = sess['events'][trial['efirst']:trial['elast']]
+        assert len(events) == 1
+        assert events['x'][0] == x
+
+        samples = sess['samples'][trial['sfirst']:trial['slast']]
+        assert samples['x'][100] == x
+
+        met = metrics.iametrics(sess)[0]
+        if eye == 'R':
+            assert list(met['nfix'][met['trial'] == 1]) == [0, 1]
+            assert list(met['dwell'][met['trial'] == 1]) == [0, 290]
+
+
+def test_chunks_agree(tmpdir):
+    whole = _parse(tmpdir)
+    for chunk in (64, 1000, 4099):
+        part = _parse(tmpdir, chunk=chunk)
+        for name in ('samples', 'events', 'trials', 'ias', 'vars', 'msgs'):
+            np.testing.assert_array_equal(part[name], whole[name])
+
+
+def test_sample_flags_and_missing_values(tmpdir):
+    # edf2asc pads values with spaces, blinks leave '.' and flags can carry
+    # letters. The last block has a short line and takes the slow path.
+    lines = ['START\t100 RIGHT\tSAMPLES\tEVENTS',
+             '100\t  512.0\t  384.0\t 1000.0\t...',
+             '101\t   .\t   .\t    0.0\tC..',
+             '102\t.\t.\t.\tI..',
+             '103\t  -12.5\t  384.0\t 1000.0\t..R',
+             'MSG\t103 note',
+             '104\t  512.0\t  384.0\t 1000.0\t...',
+             '105\t  512.0\t  384.0',
+             'END\t106 \tSAMPLES\tEVENTS']
+    path = tmpdir.join('flags.asc')
+    path.write('\n'.join(lines) + '\n')
+
+    samp = ascparse.parse(str(path))['samples']
+    nan = np.nan
+    np.testing.assert_array_equal(samp['time'], range(100, 106))
+    np.testing.assert_array_equal(samp['x'],
+                                  [512, nan, nan, -12.5, 512, 512])
+    np.testing.assert_array_equal(samp['pupil'],
+                                  [1000, 0, nan, 1000, 1000, nan])
@@ -0,0 +1,55 @@
+import wave
+import numpy as np
+import pytest
+import beeps
+
+
+def test_tone_ramps():
+    snd = beeps.tone(800, .1, rate=8000)
+
+    assert len(snd) == 800
+    assert snd.dtype == np.float32
+    assert abs(snd[0]) < 1e-6 and abs(snd[-1]) < .05
+    assert np.abs(snd).max() <= 1
+
+
+def test_null_backend():
+    beep = beeps.beeper('null')
+    beep.prewarm()
+    for name in ('target', 'done', 'error', 'target'):
+        beep.play(name)
+    beep.wait()
+
+    assert beep.stats()['n'] == 4
+    beep.close()
+    beep.close()
+    assert not beep._thread.is_alive()
+
+
+def test_wave_backend(tmpdir):
+    path = str(tmpdir.join('sub', 'beeps.wav'))
+    beep = beeps.beeper('wave', wavpath=path, rate=8000)
+    beep.prewarm()
+    order = ['target', 'target', 'done', 'error']
+    for name in order:
+        beep.play(name)
+    beep.close()
+    beep.close()
+
+    wav = wave.open(path, 'rb')
+    assert (wav.getnchannels(), wav.getsampwidth(),
+            wav.getframerate()) == (1, 2, 8000)
+    frames = wav.readframes(wav.getnframes())
+    wav.close()
+    assert frames == b''.join(beep.pcm[name] for name in order)
+
+    played = np.frombuffer(frames, dtype='<i2')[:800] / 32767.0
+    assert np.allclose(played, beep.buffers['target'], atol=1e-4)
+    assert beep.stats()['n'] == 4
+
+
+def test_bad_backend():
+    with pytest.raises(ValueError):
+        beeps.beeper('speaker')
+    with pytest.raises(ValueError):
+        beeps.beeper('wave')
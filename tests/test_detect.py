@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+import detect
+import linkconst
+import stream
+import synth
+
+PPD = 35.0
+TARGETS = [[960, 540], [1300, 540], [620, 540], [960, 250], [960, 830]]
+
+
+def _rows(samples, eye='r'):
+    # Link rows as gazestream buffers them
+    rows = np.zeros(len(samples), dtype=stream.SDTYPE)
+    rows['time'] = samples['time']
+    rows['lx'] = rows['ly'] = rows['rx'] = rows['ry'] = np.nan
+    rows[eye + 'x'] = samples['x']
+    rows[eye + 'y'] = samples['y']
+    rows['etype'] = linkconst.SAMPLE_TYPE
+
+    return rows
+
+
+def _detect(samples, batch, **kwargs):
+    det = detect.ivt(PPD, **kwargs)
+    rows = _rows(samples)
+    events = []
+    for b in range(0, len(rows), batch):
+        events += det.update(rows[b:b + batch])
+
+    return [ev for ev in events if ev['type'] == 'fixation']
+
+
+@pytest.mark.parametrize('srate', [500, 1000, 2000])
+@pytest.mark.parametrize('batch', [7, 100, 100000])
+def test_finds_synth_fixations(srate, batch):
+    rng = np.random.RandomState(1)
+    samples, events = synth.scanpath(6000, TARGETS, srate=srate, ppd=PPD,
+                                     blinkrate=0, rng=rng)
+
+    # Every saccade is well above threshold, none are refixations that
+    # stay below it
+    sacc = events[events['etype'] == b'S']
+    amp = np.hypot(sacc['ex'] - sacc['x'], sacc['ey'] - sacc['y']) / PPD
+    peak = amp * np.pi / 2 / ((sacc['end'] - sacc['start']) / 1000.0)
+    assert peak.min() > 60
+
+    # The last fixation is still going when the data ends
+    fix = events[events['etype'] == b'F'][:-1]
+    found = _detect(samples, batch)
+
+    assert len(fix) == 20
+    assert len(found) == len(fix)
+    assert np.abs([ev['start'] for ev in found] - fix['start']).max() <= 10
+    assert np.abs([ev['end'] for ev in found] - fix['end']).max() <= 10
+
+
+def _still(rng):
+    # One second on the centre with 0.01 deg noise, then a 40 ms saccade
+    samples = np.zeros(1100, dtype=synth.GDTYPE)
+    samples['time'] = np.arange(1100)
+    samples['x'] = 960 + np.r_[np.zeros(1000), np.linspace(0, 10 * PPD, 40),
+                               np.full(60, 10 * PPD)]
+    samples['y'] = 540
+    samples['x'] += rng.normal(0, .01 * PPD, 1100)
+    samples['y'] += rng.normal(0, .01 * PPD, 1100)
+
+    return samples
+
+
+def test_noise_spike_keeps_fixation():
+    samples = _still(np.random.RandomState(0))
+    samples['x'][500] += PPD
+
+    found = _detect(samples, 64)
+    assert len(found) == 1
+    assert found[0]['start'] == 2
+    assert abs(found[0]['end'] - 1000) <= 5
+
+
+def test_gap_ends_fixation():
+    samples = _still(np.random.RandomState(0))
+    samples['x'][400:500] = np.nan
+
+    found = _detect(samples, 64)
+    assert len(found) == 2
+    assert found[0]['end'] < 400
+    assert found[1]['start'] > 500
@@ -0,0 +1,54 @@
+import os
+import pytest
+import columns
+import pipeline
+import records
+
+RECORD = records.trialrecord([('sub', str), ('tnum', int), ('rt', float)])
+
+
+def _session(datadir, sid, record=RECORD):
+    # Results CSV plus the typed columns next to it, like resultswriter
+    base = os.path.join(str(datadir), sid + '_mindwand_exp2')
+    with open(base + '.csv', 'w') as cf:
+        cf.write('sub,tnum,rt\n')
+    rows = [record.serialize({'sub': sid, 'tnum': t, 'rt': .5 + t})
+            for t in range(3)]
+    writer = columns.columnwriter(base + '_cols', record)
+    writer.append(rows)
+    writer.close()
+
+    return base + '_cols'
+
+
+def test_concat_rejects_mismatched_types(tmpdir):
+    a = _session(tmpdir, '101')
+    b = _session(tmpdir, 'abc', records.trialrecord(
+        [('sub', str), ('tnum', float), ('rt', float)]))
+
+    with pytest.raises(ValueError) as err:
+        columns.concat([a, b])
+    assert 'tnum' in str(err.value)
+
+
+def test_concat_rejects_missing_columns(tmpdir):
+    a = _session(tmpdir, '101')
+    b = _session(tmpdir, 'abc', records.trialrecord(
+        [('sub', str), ('tnum', int)]))
+
+    with pytest.raises(ValueError):
+        columns.concat([a, b])
+
+
+def test_run_uses_typed_columns(tmpdir):
+    # Numeric and alphanumeric ids stay one str column
+    _session(tmpdir, '101')
+    _session(tmpdir, 'abc')
+
+    group = pipeline.run(str(tmpdir), procs=1)
+    sub = columns.decode(group['behav']['sub'], group['levels']['sub'])
+
+    assert group['subjects'] == ['101', 'abc']
+    assert list(sub) == ['101'] * 3 + ['abc'] * 3
+    assert list(group['behav']['tnum']) == [0, 1, 2] * 2
+    assert list(group['behavsubject']) == [0] * 3 + [1] * 3
@@ -0,0 +1,62 @@
+import time
+import numpy as np
+import ascparse
+import linkconst
+import simtracker
+
+
+def _record(tmpdir, eye, flags=(1, 1, 1, 1)):
+    # fixCheck style recording, then a trial recorded with the given flags
+    sim = simtracker.simtracker(str(tmpdir), latency=(0, 0), modedelay=0,
+                                eye=eye)
+    sim.setGaze([300.0, 310.0], [200.0, 210.0], [900.0, 950.0])
+    sim.openDataFile('test.asc')
+
+    sim.startRecording(0, 0, 1, 1)
+    time.sleep(.05)
+    sim.stopRecording()
+    sim.sendMessage('TRIALID 1')
+    sim.startRecording(*flags)
+    time.sleep(.05)
+    sim.stopRecording()
+    sim.closeDataFile()
+
+    return str(tmpdir.join('test.asc'))
+
+
+def test_link_only_recording_writes_no_samples(tmpdir):
+    path = _record(tmpdir, linkconst.RIGHT_EYE)
+    with open(path) as asc:
+        lines = asc.read().splitlines()
+
+    # Only the trial's recording has samples in the file
+    trial = [i for i, l in enumerate(lines) if 'TRIALID' in l][0]
+    assert not any(l[0].isdigit() for l in lines[:trial])
+    assert lines[1].startswith('START') and 'SAMPLES' not in lines[1]
+
+    data = ascparse.parse(path)
+    trial = data['trials'][0]
+    assert trial['slast'] - trial['sfirst'] == len(data['samples']) > 0
+
+
+def test_link_samples_follow_the_link_flag(tmpdir):
+    sim = simtracker.simtracker(str(tmpdir), latency=(0, 0), modedelay=0)
+    sim.startRecording(1, 1, 0, 0)
+    time.sleep(.01)
+    assert sim.getNextData() == 0
+
+    sim.startRecording(0, 0, 1, 1)
+    time.sleep(.01)
+    assert sim.getNextData() == linkconst.SAMPLE_TYPE
+
+
+def test_binocular_samples_parse(tmpdir):
+    path = _record(tmpdir, linkconst.BINOCULAR)
+
+    for eye in 'LR':
+        samp = ascparse.parse(path, eye=eye)['samples']
+        assert len(samp)
+        assert set(samp['x']) <= {300.0, 310.0}
+        assert set(samp['y']) <= {200.0, 210.0}
+        assert set(samp['pupil']) <= {900.0, 950.0}
+        assert np.all(np.diff(samp['time']) == 1)
@@ -0,0 +1,66 @@
+import numpy as np
+import metrics
+import spatial
+
+IADTYPE = [('trial', 'i4'), ('l', 'f4'), ('t', 'f4'), ('r', 'f4'),
+           ('b', 'f4')]
+
+
+def _random_ias(rng, ntrials, most=40):
+    # Rectangles of many sizes that often overlap, grouped by trial
+    rows = []
+    for tnum in range(ntrials):
+        for k in range(rng.randint(0, most)):
+            l, t = rng.uniform(0, 1800), rng.uniform(0, 1000)
+            w, h = rng.uniform(1, 300), rng.uniform(1, 300)
+            rows.append((tnum, l, t, l + w, t + h))
+
+    return np.array(rows, dtype=IADTYPE)
+
+
+def _brute(ias, ntrials, trial, x, y):
+    pts = np.zeros(len(x), dtype=[('x', 'f8'), ('y', 'f8')])
+    pts['x'], pts['y'] = x, y
+    rects, rows = metrics.iaindex(ias, ntrials)
+
+    return metrics.hitrows(pts, trial, rects, rows)
+
+
+def test_agrees_with_hitrows():
+    rng = np.random.RandomState(3)
+    ntrials = 40
+    ias = _random_ias(rng, ntrials)
+
+    # Random points plus every corner, edges count as inside
+    n = 20000
+    trial = np.concatenate([rng.randint(0, ntrials, n), ias['trial'],
+                            ias['trial']])
+    x = np.concatenate([rng.uniform(-50, 2150, n), ias['l'], ias['r']])
+    y = np.concatenate([rng.uniform(-50, 1350, n), ias['t'], ias['b']])
+
+    want = _brute(ias, ntrials, trial, x, y)
+    assert (want >= 0).sum() > n // 10
+    for cell in (None, 5.0, 80.0, 2000.0):
+        grid = spatial.iagrid(ias, ntrials, cell)
+        assert np.array_equal(grid.lookup(trial, x, y), want)
+
+
+def test_first_listed_wins():
+    # Inner rectangle listed second, then first
+    ias = np.array([(0, 0, 0, 100, 100), (0, 40, 40, 60, 60),
+                    (1, 40, 40, 60, 60), (1, 0, 0, 100, 100)],
+                   dtype=IADTYPE)
+    trial, x, y = [0, 0, 1, 1], [50, 10, 50, 10], [50, 10, 50, 10]
+
+    grid = spatial.iagrid(ias, 2)
+    assert list(grid.lookup(trial, x, y)) == [0, 0, 2, 3]
+    assert list(_brute(ias, 2, np.array(trial), x, y)) == [0, 0, 2, 3]
+
+
+def test_thin_rectangle_keeps_grid_small():
+    ias = np.array([(0, 0, 0, 1920, 1080), (0, 500, 0, 500.01, 1080)],
+                   dtype=IADTYPE)
+    grid = spatial.iagrid(ias, 1)
+
+    assert grid.nx * grid.ny <= 2 * spatial.MAXCELLS
+    assert list(grid.lookup([0, 0], [500.005, 10], [5, 5])) == [0, 0]
@@ -0,0 +1,159 @@
+import threading
+import time
+import linkconst
+import stream
+
+
+class busytracker(object):
+    # Records calls that overlap with another thread's call
+    def __init__(self):
+        self.inside = 0
+        self.overlaps = 0
+        self.sent = 0
+        self.guard = threading.Lock()
+
+    def _enter(self):
+        with self.guard:
+            self.inside += 1
+            if self.inside > 1:
+                self.overlaps += 1
+        time.sleep(.0001)
+        with self.guard:
+            self.inside -= 1
+
+    def getNextData(self):
+        self._enter()
+        return 0
+
+    def getFloatData(self):
+        self._enter()
+
+    def sendMessage(self, txt):
+        self._enter()
+        self.sent += 1
+
+
+def test_stream_and_main_thread_take_turns():
+    raw = busytracker()
+    gaze = stream.gazestream(raw, poll=0)
+    gaze.start()
+    try:
+        for i in range(500):
+            gaze.tracker.sendMessage('msg {}'.format(i))
+    finally:
+        gaze.stop()
+
+    assert raw.sent == 500
+    assert raw.overlaps == 0
+
+
+def test_shares_a_given_lock():
+    locked = stream.lockedtracker(busytracker())
+    gaze = stream.gazestream(locked)
+
+    assert gaze.tracker is locked
+    with locked.lock:
+        assert locked.sendMessage('nested') is None
+
+
+class feedtracker(object):
+    # Hands out n right eye samples once go is set, then nothing
+    def __init__(self, n):
+        self.n = n
+        self.t = 0
+        self.go = threading.Event()
+
+    def getNextData(self):
+        if self.go.is_set() and self.t < self.n:
+            return linkconst.SAMPLE_TYPE
+        return 0
+
+    def getFloatData(self):
+        self.t += 1
+
+        return feedsample(self.t)
+
+
+class feedsample(object):
+    def __init__(self, t):
+        self.t = t
+
+    def isLeftSample(self):
+        return False
+
+    def isRightSample(self):
+        return True
+
+    def getRightEye(self):
+        return self
+
+    def getGaze(self):
+        return (self.t, linkconst.MISSING_DATA)
+
+    def getPupilSize(self):
+        return 1000.0
+
+    def getTime(self):
+        return self.t
+
+
+def _filled(n, size=5):
+    gaze = stream.gazestream(busytracker(), size=size)
+    for t in range(n):
+        gaze._push((t, 0, 0, 0, 0, 0, 0, linkconst.SAMPLE_TYPE))
+
+    return gaze
+
+
+def test_window_wraps():
+    assert len(_filled(0).window()) == 0
+
+    gaze = _filled(12)
+    assert list(gaze.window()['time']) == [7, 8, 9, 10, 11]
+    assert list(gaze.window(3)['time']) == [9, 10, 11]
+    assert list(gaze.window(100)['time']) == [7, 8, 9, 10, 11]
+    assert list(_filled(3).window()['time']) == [0, 1, 2]
+
+
+def test_halves_match():
+    for n in range(13):
+        gaze = _filled(n)
+        assert (gaze.buff[:gaze.size] == gaze.buff[gaze.size:]).all()
+
+
+def test_since_bounds():
+    gaze = _filled(12)
+
+    rows, mark = gaze.since(0)
+    assert list(rows['time']) == [7, 8, 9, 10, 11]
+    assert mark == 12
+
+    rows, mark = gaze.since(12)
+    assert len(rows) == 0
+    assert mark == 12
+
+    assert list(gaze.since(10)[0]['time']) == [10, 11]
+    assert list(gaze.since(6)[0]['time']) == [7, 8, 9, 10, 11]
+    assert list(gaze.since(7)[0]['time']) == [7, 8, 9, 10, 11]
+
+
+def test_samples_yields_each_row_once():
+    raw = feedtracker(300)
+    gaze = stream.gazestream(raw, size=1000, poll=0)
+    gaze.start()
+    # Samples start arriving after the generator takes its first mark
+    threading.Timer(.05, raw.go.set).start()
+    try:
+        times = []
+        for rows in gaze.samples(timeout=.2):
+            times.extend(rows['time'])
+            if len(times) >= 300:
+                break
+    finally:
+        gaze.stop()
+
+    rows = gaze.window(1)
+    assert times == list(range(1, 301))
+    assert rows['rx'][0] == 300
+    assert rows['ry'][0] != rows['ry'][0]
+    assert rows['lx'][0] != rows['lx'][0]